@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+from litellm import completion
+
+from create_toc import HEURISTIC_MODEL, create_line_toc, create_toc
+from heading_index import HeadingIndex
+from line_toc import line_toc_anchors, line_toc_to_markdown
+from pdf_text_extractor import extract_text_from_pdf
+from pipeline_stats import PipelineStats, instrument, stage
+from toc_cache import TocCache
+from toc_content_extractor import IncrementalExtraction, TocContentExtractor
+from toc_repair import repair_failed_headings
+
+MANIFEST_FILENAME = "manifest.jsonl"
+DOCUMENT_EXTENSIONS = (".pdf", ".txt", ".md")
+
+
+def find_documents(input_path):
+    """
+    Lists the documents to process.
+
+    Args:
+        input_path: A directory (searched recursively for PDF and text files)
+            or a manifest file listing one document path per line.
+
+    Returns:
+        A list of document paths, sorted for directories and in file order for manifests.
+        A path listed several times in a manifest (e.g. a results manifest of resumed runs) is kept once.
+    """
+    if os.path.isdir(input_path):
+        documents = []
+        for root, _, filenames in os.walk(input_path):
+            for filename in filenames:
+                if filename.lower().endswith(DOCUMENT_EXTENSIONS):
+                    documents.append(os.path.join(root, filename))
+        return sorted(documents)
+
+    base_directory = os.path.dirname(os.path.abspath(input_path))
+    documents = []
+    with open(input_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            # JSONL manifests (e.g. a previous results manifest) give the path in "source"
+            path = json.loads(line)["source"] if line.startswith("{") else line
+            documents.append(os.path.join(base_directory, path))
+    return list(dict.fromkeys(documents))
+
+
+def output_paths(document_path, root_directory, output_directory):
+    """Returns the (markdown, toc) output paths of a document, mirroring its path under root_directory."""
+    relative_path = os.path.relpath(document_path, root_directory)
+    stem = os.path.splitext(relative_path)[0]
+    return (
+        os.path.join(output_directory, stem + ".md"),
+        os.path.join(output_directory, stem + ".toc.md"),
+    )
+
+
+def is_up_to_date(document_path, markdown_path):
+    """Returns True if the output exists and is newer than the document."""
+    return (
+        os.path.exists(markdown_path)
+        and os.path.getmtime(markdown_path) >= os.path.getmtime(document_path)
+    )
+
+
+def read_document_text(document_path):
+    """Extracts the text of a PDF file, or reads a text file."""
+    if document_path.lower().endswith(".pdf"):
+        return extract_text_from_pdf(document_path)
+    with open(document_path, encoding="utf-8") as f:
+        return f.read()
+
+
+@lru_cache(maxsize=None)
+def load_heading_index(path):
+    """Loads a heading index once per worker process."""
+    return HeadingIndex.load(path)
+
+
+@lru_cache(maxsize=None)
+def load_extractor(toc_max_level=3, engine="regex", heading_index_path=None):
+    """
+    Builds a TocContentExtractor once per worker process and options, so the compiled
+    heading patterns are reused across the documents of a batch (e.g. reports sharing a template).
+    """
+    return TocContentExtractor(
+        toc_max_level=toc_max_level,
+        engine=engine,
+        heading_index=load_heading_index(heading_index_path) if heading_index_path else None,
+    )
+
+
+def extract_by_toc(text, cache, options):
+    """
+    Generates a Markdown TOC and extracts the sections by searching for its headings.
+    With the repair option, the headings that were not found are asked again for their regions
+    of the text only (see toc_repair.repair_failed_headings).
+
+    Returns:
+        A tuple (toc, markdown_content, match_success, match_failed) with the numbers of found and missing headings.
+    """
+    toc = create_toc(
+        text,
+        options["model"],
+        window_size=options.get("window_size"),
+        cache=cache,
+        completion_fn=options.get("completion_fn", completion),
+        prefilter=options.get("prefilter", False),
+        heuristic_fallback=options.get("heuristic_fallback", False),
+    )
+    if toc is None:
+        raise RuntimeError("TOC generation failed.")
+
+    extractor = load_extractor(
+        options.get("toc_max_level", 3),
+        options.get("engine", "regex"),
+        options.get("heading_index_path"),
+    )
+    if options.get("repair") and options["model"] != HEURISTIC_MODEL:
+        # Extract once, keeping the state needed to re-extract only the repaired sections
+        with stage("extract"):
+            extraction = IncrementalExtraction(extractor, toc, text)
+            result = extraction.result(verbose=True)
+        if result["match_failed"]:
+            repair_failed_headings(
+                extraction,
+                options["model"],
+                completion_fn=options.get("completion_fn", completion),
+                cache=cache,
+            )
+            toc = "\n".join(extraction.toc_list)
+            result = extraction.result(verbose=True)
+    else:
+        result = extractor.extract_content_by_toc(toc, text, verbose=True)
+    return toc, result["markdown_content"], len(result["match_success"]), len(result["match_failed"])
+
+
+def extract_by_line_numbers(text, cache, options):
+    """
+    Generates a line-numbered TOC (see create_toc.create_line_toc) and slices the sections
+    at the heading lines, without searching for the headings. Sections keep the original text.
+
+    Returns:
+        The same tuple as extract_by_toc; no heading can be missing in this mode.
+    """
+    headings = create_line_toc(
+        text,
+        options["model"],
+        cache=cache,
+        completion_fn=options.get("completion_fn", completion),
+        prefilter=options.get("prefilter", False),
+        heuristic_fallback=options.get("heuristic_fallback", False),
+    )
+    if headings is None:
+        raise RuntimeError("TOC generation failed.")
+
+    extractor = load_extractor(options.get("toc_max_level", 3))
+    with stage("extract"):
+        records = extractor.extract_sections_at(line_toc_anchors(headings, text), text)
+        markdown_content = "\n".join(record.toc_line + "\n" + record.content for record in records)
+    return line_toc_to_markdown(headings, text), markdown_content, len(records), 0
+
+
+def process_document(document_path, markdown_path, toc_path, options):
+    """
+    Runs text extraction, TOC generation and TOC-based content extraction for one document
+    and writes its outputs. Runs in a worker process.
+
+    Returns:
+        The result record of the document (dictionary) for the results manifest.
+    """
+    start = time.perf_counter()
+    record = {"source": document_path, "output": markdown_path, "toc": toc_path}
+    stats = PipelineStats()
+    try:
+        with instrument(stats):
+            text = read_document_text(document_path)
+            cache = TocCache(options["cache_path"]) if options.get("cache_path") else None
+            try:
+                extract = extract_by_line_numbers if options.get("line_numbers") else extract_by_toc
+                toc, markdown_content, match_success, match_failed = extract(text, cache, options)
+            finally:
+                if cache is not None:
+                    cache.close()
+
+            os.makedirs(os.path.dirname(markdown_path) or ".", exist_ok=True)
+            with open(toc_path, "w", encoding="utf-8") as f:
+                f.write(toc)
+            # Written last, so a document only counts as up to date once all outputs exist
+            with open(markdown_path, "w", encoding="utf-8") as f:
+                f.write(markdown_content)
+
+            record.update(
+                status="ok",
+                text_length=len(text),
+                match_success=match_success,
+                match_failed=match_failed,
+            )
+    except Exception as e:
+        record.update(status="failed", error=str(e))
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    # Per-stage durations and counters, to see where the time of slow documents went
+    record["stats"] = {"durations": dict(stats.durations), "counters": dict(stats.counters)}
+    return record
+
+
+def process_documents(
+    input_path,
+    output_directory,
+    model,
+    max_workers=None,
+    force=False,
+    **options,
+):
+    """
+    Processes every document of a directory or manifest file with a pool of worker processes.
+
+    Outputs are written under output_directory and the result record of each processed
+    document is appended to its manifest.jsonl as soon as the document finishes. Documents
+    whose outputs are newer than the document are skipped, so an interrupted run resumes
+    where it stopped.
+
+    Args:
+        input_path: A directory of documents or a manifest file (see find_documents).
+        output_directory: The directory for the outputs and the results manifest.
+        model: The model used for TOC generation.
+        max_workers: The number of worker processes (defaults to the number of CPUs).
+        force: If True, documents are processed even if their outputs are up to date.
+        **options: Passed to process_document: toc_max_level, engine, window_size,
+            cache_path, heading_index_path (see heading_index.py), prefilter,
+            heuristic_fallback, line_numbers (see extract_by_line_numbers), repair
+            (see extract_by_toc) and completion_fn.
+
+    Returns:
+        The list of result records of this run, including skipped documents.
+    """
+    documents = find_documents(input_path)
+    if os.path.isdir(input_path):
+        root_directory = input_path
+    else:
+        root_directory = os.path.commonpath([os.path.dirname(d) for d in documents] or ["."])
+    options["model"] = model
+
+    os.makedirs(output_directory, exist_ok=True)
+    manifest_path = os.path.join(output_directory, MANIFEST_FILENAME)
+    records = []
+    with open(manifest_path, "a", encoding="utf-8") as manifest, ProcessPoolExecutor(
+        max_workers=max_workers
+    ) as executor:
+        futures = []
+        for document_path in documents:
+            markdown_path, toc_path = output_paths(document_path, root_directory, output_directory)
+            if not force and is_up_to_date(document_path, markdown_path):
+                records.append({"source": document_path, "output": markdown_path, "status": "skipped"})
+                continue
+            futures.append(
+                executor.submit(process_document, document_path, markdown_path, toc_path, options)
+            )
+
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+            manifest.flush()
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Converts a directory or manifest of documents into structured Markdown."
+    )
+    parser.add_argument("input_path", help="A directory of PDF/text files or a manifest file listing them.")
+    parser.add_argument("output_directory")
+    parser.add_argument("--model", default="gemini/gemini-1.5-flash", help='"heuristic" builds TOCs without an LLM.')
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--toc-max-level", type=int, default=3)
+    parser.add_argument("--engine", choices=TocContentExtractor.ENGINES, default="regex")
+    parser.add_argument("--window-size", type=int, default=None)
+    parser.add_argument("--cache", dest="cache_path", default=None, help="SQLite file for the TOC cache.")
+    parser.add_argument("--heading-index", dest="heading_index_path", default=None, help="Heading index file built by heading_index.py.")
+    parser.add_argument("--prefilter", action="store_true", help="Send only likely heading lines to the model.")
+    parser.add_argument("--heuristic-fallback", action="store_true", help="Use the heuristic TOC when the model call fails.")
+    parser.add_argument("--line-numbers", action="store_true", help="Ask the model for heading line numbers instead of heading text.")
+    parser.add_argument("--repair", action="store_true", help="Ask the model again for the headings that were not found, sending only their regions.")
+    parser.add_argument("--force", action="store_true", help="Reprocess documents whose outputs are up to date.")
+    args = parser.parse_args()
+
+    records = process_documents(
+        args.input_path,
+        args.output_directory,
+        args.model,
+        max_workers=args.workers,
+        force=args.force,
+        toc_max_level=args.toc_max_level,
+        engine=args.engine,
+        window_size=args.window_size,
+        cache_path=args.cache_path,
+        heading_index_path=args.heading_index_path,
+        prefilter=args.prefilter,
+        heuristic_fallback=args.heuristic_fallback,
+        line_numbers=args.line_numbers,
+        repair=args.repair,
+    )
+    counts = {}
+    for record in records:
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+    print(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import time
+import tracemalloc
+import unicodedata
+
+from heading_candidates import find_heading_candidates, format_heading_candidates
+from pdf_text_extractor import extract_text_from_pdf, extract_text_from_pdf_parallel
+from text_normalizer import normalize_text
+from toc_content_extractor import TocContentExtractor
+
+DOCUMENT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000, 50_000_000]
+HEADING_COUNTS = [10, 100, 1000, 5000]
+
+JAPANESE_SENTENCES = [
+    "勇者ロトは新たな冒険に出た。",
+    "魔王軍は世界各地に侵攻を開始した。",
+    "エルフの森が魔王軍の攻撃を受けた。",
+    "ドワーフの砦は長い包囲に耐えていた。",
+    "古文書には闇の儀式について記されていた。",
+    "仲間は、戦士、魔法使い、僧侶、賢者で構成されていた。",
+    "ＡＢＣ１２３の全角文字と ｶﾀｶﾅ の半角文字が混在している。",
+]
+ENGLISH_SENTENCES = [
+    "The hero set out on a new adventure.",
+    "The demon army began its invasion of the world.",
+    "The elven forest came under attack.",
+    "The dwarven fortress endured a long siege.",
+    "An ancient manuscript described the dark ritual.",
+    "The party consisted of a warrior, a mage, a priest and a sage.",
+    "Full-width ＡＢＣ１２３ and half-width text are mixed here.",
+]
+JAPANESE_WORDS = ["旅立ち", "魔王", "復活", "試練", "洞窟", "盗賊団", "仲間", "帰還", "再建", "予感"]
+ENGLISH_WORDS = ["Journey", "Demon", "Revival", "Trial", "Cave", "Bandits", "Allies", "Return", "Rebuilding", "Omen"]
+
+
+def generate_document(
+    size, heading_count, language="ja", missing_ratio=0.05, garbled_ratio=0.05, seed=0
+):
+    """
+    Generates a synthetic document and its TOC in the style of the test.py fixture:
+    headings appear in the content with spaced-out glyphs (e.g. "魔 王 の 復 活"),
+    and some headings are missing from the content or garbled. Each title also carries its
+    number in its middle (e.g. "4. 再(4)建の予感"), so a missing or garbled heading only
+    affects its own section.
+
+    Args:
+        size: The approximate length of the content in characters.
+        heading_count: The number of TOC headings (levels 1 to 3, all distinct).
+        language: "ja" or "en".
+        missing_ratio: The ratio of headings left out of the content.
+        garbled_ratio: The ratio of headings with one character replaced in the content.
+        seed: The random seed, so the same arguments always give the same document.
+
+    Returns:
+        A tuple (toc, content) of strings.
+    """
+    rng = random.Random(seed)
+    if language == "ja":
+        sentences, words, joiner = JAPANESE_SENTENCES, JAPANESE_WORDS, "の"
+    else:
+        sentences, words, joiner = ENGLISH_SENTENCES, ENGLISH_WORDS, " of the "
+
+    toc_lines = []
+    parts = []
+    section_size = max(1, size // heading_count)
+    for index in range(heading_count):
+        level = 1 if index == 0 else rng.choice((2, 2, 3))
+        # Failed searches trim headings from both ends, so the number in the middle keeps every
+        # trimmed form unique instead of matching a later heading with the same words
+        prefix = f"{index + 1}. "
+        words_text = f"{rng.choice(words)}{joiner}{rng.choice(words)}"
+        middle = max(0, (len(words_text) - len(prefix)) // 2)
+        title = f"{prefix}{words_text[:middle]}({index + 1}){words_text[middle:]}"
+        toc_lines.append("#" * level + " " + title)
+
+        chance = rng.random()
+        if chance < missing_ratio:
+            heading_text = ""
+        elif chance < missing_ratio + garbled_ratio:
+            position = rng.randrange(len(title))
+            heading_text = title[:position] + "＊" + title[position + 1 :] + "\n"
+        else:
+            heading_text = title + "\n"
+        if language == "ja":
+            heading_text = " ".join(heading_text)
+        parts.append(heading_text)
+
+        body_length = 0
+        while body_length < section_size:
+            sentence = rng.choice(sentences)
+            parts.append(sentence + ("\n" if rng.random() < 0.3 else " "))
+            body_length += len(sentence) + 1
+        parts.append("\n")
+    return "\n".join(toc_lines), "".join(parts)
+
+
+def _best_time(function, args, repeat):
+    """Returns the fastest time of repeat runs of function and the value it returned."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), value
+
+
+def _peak_memory(function, args):
+    """Returns the peak memory in bytes allocated by Python while running function."""
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_pdf_extraction(pdf_path, worker_counts=(1, 2, 4), repeat=1):
+    """
+    Compares the serial PDF text extraction with the page-parallel extraction.
+
+    Args:
+        pdf_path: Path to the PDF file.
+        worker_counts: The numbers of worker processes to measure.
+        repeat: The number of runs per configuration; the fastest is reported.
+
+    Returns:
+        A list of result dictionaries with 'mode', 'workers' and 'seconds'.
+    """
+    results = [
+        {
+            "mode": "serial",
+            "workers": 1,
+            "seconds": _best_time(extract_text_from_pdf, (pdf_path,), repeat)[0],
+        }
+    ]
+    for workers in worker_counts:
+        results.append(
+            {
+                "mode": "parallel",
+                "workers": workers,
+                "seconds": _best_time(extract_text_from_pdf_parallel, (pdf_path, workers), repeat)[0],
+            }
+        )
+    return results
+
+
+def benchmark_normalization(text, repeat=3):
+    """
+    Compares the previous NFKC and regular-expression normalization with normalize_text.
+
+    Args:
+        text: The text to normalize.
+        repeat: The number of runs per mode; the fastest is reported.
+
+    Returns:
+        A list of result dictionaries with 'mode', 'seconds' and 'mb_per_second'.
+    """
+
+    def normalize_with_nfkc(text):
+        return re.sub(r"[\s\u3000]+", "", unicodedata.normalize("NFKC", text).lower())
+
+    megabytes = len(text.encode("utf-8")) / 1e6
+    results = []
+    for mode, function in (("nfkc", normalize_with_nfkc), ("normalize_text", normalize_text)):
+        seconds = _best_time(function, (text,), repeat)[0]
+        results.append({"mode": mode, "seconds": seconds, "mb_per_second": megabytes / seconds})
+    return results
+
+
+def benchmark_extractor(
+    sizes=DOCUMENT_SIZES,
+    heading_counts=HEADING_COUNTS,
+    languages=("ja", "en"),
+    engines=("automaton", "fuzzy"),
+    repeat=1,
+    measure_memory=True,
+):
+    """
+    Measures TocContentExtractor on synthetic documents (see generate_document)
+    for every combination of language, size and heading count.
+
+    The time of each operation is measured without tracing; the peak memory is measured
+    in a separate run under tracemalloc, which slows Python down.
+
+    Note that the regex engine is quadratic in the document size for every heading
+    missing from the content, so it is only practical for small sizes.
+
+    Args:
+        sizes: The document sizes in characters.
+        heading_counts: The numbers of TOC headings.
+        languages: The languages of the documents ("ja" and/or "en").
+        engines: The extractor engines measured for extract_content_by_toc.
+        repeat: The number of timed runs per operation; the fastest is reported.
+        measure_memory: If False, peak_bytes is reported as None.
+
+    Returns:
+        A list of result dictionaries with 'language', 'size', 'headings', 'operation',
+        'engine', 'seconds', 'peak_bytes' and 'match_failed'.
+    """
+    results = []
+    for language in languages:
+        for size in sizes:
+            for heading_count in heading_counts:
+                toc, content = generate_document(size, heading_count, language)
+                extractor = TocContentExtractor()
+                operations = [
+                    ("normalize", None, extractor.normalize, (content,)),
+                    (
+                        "generate_filtered_toc",
+                        None,
+                        extractor.generate_filtered_toc,
+                        (toc.splitlines(), extractor.toc_max_level),
+                    ),
+                ]
+                for engine in engines:
+                    engine_extractor = TocContentExtractor(engine=engine)
+                    operations.append(
+                        (
+                            "extract_content_by_toc",
+                            engine,
+                            engine_extractor.extract_content_by_toc,
+                            (toc, content, True),
+                        )
+                    )
+
+                for operation, engine, function, args in operations:
+                    seconds, value = _best_time(function, args, repeat)
+                    result = {
+                        "language": language,
+                        "size": size,
+                        "headings": heading_count,
+                        "operation": operation,
+                        "engine": engine,
+                        "seconds": seconds,
+                        "peak_bytes": _peak_memory(function, args) if measure_memory else None,
+                        "match_failed": None,
+                    }
+                    if operation == "extract_content_by_toc":
+                        result["match_failed"] = len(value["match_failed"])
+                    results.append(result)
+    return results
+
+
+def _result_key(result):
+    return (
+        result["language"],
+        result["size"],
+        result["headings"],
+        result["operation"],
+        result["engine"],
+    )
+
+
+def compare_results(baseline, results):
+    """
+    Compares extractor benchmark results with a baseline run.
+
+    Args:
+        baseline: The results of the baseline run (list of result dictionaries).
+        results: The results of the current run.
+
+    Returns:
+        A list of (result, time ratio) tuples for the results present in both runs;
+        a ratio above 1 means the current run is slower.
+    """
+    baseline_seconds = {_result_key(result): result["seconds"] for result in baseline}
+    comparisons = []
+    for result in results:
+        seconds = baseline_seconds.get(_result_key(result))
+        if seconds:
+            comparisons.append((result, result["seconds"] / seconds))
+    return comparisons
+
+
+def benchmark_prefilter(documents, min_score=2):
+    """
+    Measures the recall of the heading-candidate prefilter against TOCs generated from the full text,
+    and how much it shrinks the text sent to the model.
+
+    A TOC heading is recalled if its normalized text appears in a candidate line.
+
+    Args:
+        documents: A list of (name, text, toc) tuples.
+        min_score: The min_score passed to find_heading_candidates.
+
+    Returns:
+        A list of result dictionaries with 'name', 'headings', 'recalled', 'recall',
+        'text_chars', 'prompt_chars' and 'seconds'.
+    """
+    results = []
+    for name, text, toc in documents:
+        start = time.perf_counter()
+        candidates = find_heading_candidates(text, min_score)
+        seconds = time.perf_counter() - start
+        candidate_keys = "\x00".join(normalize_text(line) for _, line in candidates)
+        headings = [
+            normalize_text(line.lstrip("#"))
+            for line in toc.splitlines()
+            if re.match(r"^#{1,6}\s", line.strip())
+        ]
+        recalled = sum(1 for heading in headings if heading and heading in candidate_keys)
+        results.append(
+            {
+                "name": name,
+                "headings": len(headings),
+                "recalled": recalled,
+                "recall": recalled / len(headings) if headings else 1.0,
+                "text_chars": len(text),
+                "prompt_chars": len(format_heading_candidates(candidates)),
+                "seconds": seconds,
+            }
+        )
+    return results
+
+
+def _current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for Document-Intelligence-with-LLM.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pdf_parser = subparsers.add_parser("pdf", help="Serial vs. page-parallel PDF text extraction.")
+    pdf_parser.add_argument("pdf_path")
+    pdf_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    pdf_parser.add_argument("--repeat", type=int, default=1)
+
+    normalize_parser = subparsers.add_parser(
+        "normalize", help="NFKC and regex vs. normalize_text on a text file."
+    )
+    normalize_parser.add_argument("text_path")
+    normalize_parser.add_argument("--repeat", type=int, default=3)
+
+    extractor_parser = subparsers.add_parser(
+        "extractor", help="TocContentExtractor on synthetic documents of various sizes."
+    )
+    extractor_parser.add_argument("--sizes", type=int, nargs="+", default=DOCUMENT_SIZES)
+    extractor_parser.add_argument("--headings", type=int, nargs="+", default=HEADING_COUNTS)
+    extractor_parser.add_argument("--languages", nargs="+", choices=["ja", "en"], default=["ja", "en"])
+    extractor_parser.add_argument(
+        "--engines", nargs="+", choices=TocContentExtractor.ENGINES, default=["automaton", "fuzzy"]
+    )
+    extractor_parser.add_argument("--repeat", type=int, default=1)
+    extractor_parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory runs.")
+    extractor_parser.add_argument("--output", default="benchmark_results.json")
+    extractor_parser.add_argument("--compare", help="A previous results file to compare with.")
+
+    prefilter_parser = subparsers.add_parser(
+        "prefilter", help="Recall and prompt reduction of the heading-candidate prefilter."
+    )
+    prefilter_parser.add_argument(
+        "--pair",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("TEXT_PATH", "TOC_PATH"),
+        help="A document and its TOC generated from the full text (repeatable). "
+        "Synthetic documents are used if omitted.",
+    )
+    prefilter_parser.add_argument("--min-score", type=int, default=2)
+
+    args = parser.parse_args()
+    if args.command == "pdf":
+        results = benchmark_pdf_extraction(args.pdf_path, args.workers, args.repeat)
+        for result in results:
+            print(f"{result['mode']:>8} workers={result['workers']}: {result['seconds']:.2f}s")
+        print(json.dumps(results))
+    elif args.command == "normalize":
+        with open(args.text_path, encoding="utf-8") as f:
+            results = benchmark_normalization(f.read(), args.repeat)
+        for result in results:
+            print(f"{result['mode']:>6}: {result['mb_per_second']:.1f} MB/s")
+        print(json.dumps(results))
+    elif args.command == "prefilter":
+        documents = []
+        for text_path, toc_path in args.pair:
+            with open(text_path, encoding="utf-8") as f, open(toc_path, encoding="utf-8") as g:
+                documents.append((text_path, f.read(), g.read()))
+        if not documents:
+            for language in ("ja", "en"):
+                for size, heading_count in ((100_000, 100), (1_000_000, 1000)):
+                    toc, text = generate_document(size, heading_count, language, 0, 0)
+                    documents.append((f"{language}-{size}-{heading_count}", text, toc))
+        results = benchmark_prefilter(documents, args.min_score)
+        for result in results:
+            print(
+                f"{result['name']}: recall={result['recall']:.3f} "
+                f"({result['recalled']}/{result['headings']}), "
+                f"prompt {result['prompt_chars']}/{result['text_chars']} chars "
+                f"(x{result['text_chars'] / max(result['prompt_chars'], 1):.1f} smaller), "
+                f"{result['seconds']:.2f}s"
+            )
+        print(json.dumps(results))
+    elif args.command == "extractor":
+        results = benchmark_extractor(
+            args.sizes,
+            args.headings,
+            args.languages,
+            args.engines,
+            args.repeat,
+            measure_memory=not args.no_memory,
+        )
+        for result in results:
+            peak = "" if result["peak_bytes"] is None else f" peak={result['peak_bytes'] / 1e6:.1f}MB"
+            print(
+                f"{result['language']} size={result['size']} headings={result['headings']} "
+                f"{result['operation']}[{result['engine'] or '-'}]: {result['seconds']:.3f}s{peak}"
+            )
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {"commit": _current_commit(), "python": platform.python_version(), "results": results},
+                f,
+                indent=2,
+            )
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as f:
+                baseline = json.load(f)
+            print(f"Compared with {baseline.get('commit')}:")
+            for result, ratio in compare_results(baseline["results"], results):
+                print(
+                    f"{result['language']} size={result['size']} headings={result['headings']} "
+                    f"{result['operation']}[{result['engine'] or '-'}]: x{ratio:.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,15 @@
-from litellm import completion
+import asyncio
+import re
+import sqlite3
+import time
+import unicodedata
+
+from litellm import acompletion, completion
+
+from heading_candidates import find_heading_candidates, format_heading_candidates
+from heuristic_toc import create_heuristic_toc, heuristic_headings
+from line_toc import LineHeading, format_numbered_lines, parse_line_toc
+from pipeline_stats import current_stats, stage
 
 
 MARKDOWN_PROMPT_TEMPLATE = """
@@ -19,25 +30,620 @@ Please structure the provided text for chunking in RAG (Retrieval-Augmented Gene
 
 """
 
-def create_toc(text, model):
+HEADING_CANDIDATES_PROMPT_TEMPLATE = """
+## Instructions
+
+The lines below were picked from a document as heading candidates, each prefixed with its line number. Some of them may be body text.
+Please structure the document for chunking in RAG (Retrieval-Augmented Generation) by following these guidelines:
+
+1. Generate a table of contents in Markdown format from the candidates that are headings.
+2. Use only the following heading notations: #, ##, ###, ####, #####, ######.
+3. Decide the hierarchy from the numbering and the order of the lines.
+4. Use the exact wording of the lines, without the line numbers. Do not change, replace, or omit any text.
+5. Exclude candidates that are not headings, such as list elements or body text.
+6. Keep the order of the lines.
+
+## Heading candidates
+
+{text}
+
+"""
+
+LINE_NUMBERS_PROMPT_TEMPLATE = """
+## Instructions
+
+The lines of a document are given below, each prefixed with its line number.
+Please structure the document for chunking in RAG (Retrieval-Augmented Generation) by following these guidelines:
+
+1. Find the lines that are headings and decide their level, from 1 (top level) to 6.
+2. Output one heading per line as the level and the line number separated by a space, e.g. "2 41". Do not copy the heading text.
+3. Integrate related items (e.g., QA) into appropriate hierarchies. For example, if a question is level 3, its answer should be level 4.
+4. Exclude list elements and body text.
+5. Keep the order of the lines, and output nothing else.
+
+## Lines
+
+{text}
+
+"""
+
+REPAIR_PROMPT_TEMPLATE = """
+## Instructions
+
+Some headings of a table of contents could not be found in the text of a document. The excerpt below is the part of the text where they should be.
+Please correct them by following these guidelines:
+
+1. Output one line for each heading under "Headings not found" that appears in the excerpt, in the order of the excerpt.
+2. Keep the heading notation (#, ##, ###, ...) of the heading.
+3. Use the exact wording from the excerpt. Do not change, replace, or omit any text of the heading.
+4. Leave out the headings that do not appear in the excerpt.
+5. Do not output the other TOC lines or the body text.
+
+{text}
+
+"""
+
+# Model name that selects the local heuristic TOC generator instead of an LLM
+HEURISTIC_MODEL = "heuristic"
+
+# Constants for windowed TOC generation (in characters)
+TOC_WINDOW_SIZE = 30000
+TOC_WINDOW_OVERLAP = 1000
+
+
+def create_toc(
+    text,
+    model,
+    window_size=None,
+    window_overlap=TOC_WINDOW_OVERLAP,
+    cache=None,
+    completion_fn=completion,
+    prefilter=False,
+    prompt_template=MARKDOWN_PROMPT_TEMPLATE,
+    heuristic_fallback=False,
+):
     """
     Generates a table of contents (TOC) from the given text using the specified model.
 
     Args:
         text: The original text to generate the TOC from.
         model: The model to use (e.g., "gemini/gemini-pro", "gpt-3.5-turbo", "claude-2").
+            HEURISTIC_MODEL ("heuristic") builds the TOC locally without an LLM (see heuristic_toc.py).
+        window_size: If set and the text is longer than this, the TOC is generated per window
+            of this many characters and merged (see create_windowed_toc).
+        window_overlap: The number of characters shared by consecutive windows.
+        cache: A TocCache to reuse TOCs of identical requests, or None.
+        completion_fn: The completion function (litellm's completion by default).
+        prefilter: If True, only the likely heading lines of the text are sent, with their
+            line numbers (see heading_candidates.py), which shrinks the prompt of long documents.
+        prompt_template: The prompt template, with a {text} placeholder.
+        heuristic_fallback: If True, a TOC built by the heuristic generator is returned
+            when the model call fails, instead of None.
 
     Returns:
         The generated TOC in Markdown format (string).
         Returns None if an error occurs.
     """
+    if model == HEURISTIC_MODEL:
+        return create_heuristic_toc(text)
+    if heuristic_fallback:
+        toc = create_toc(
+            text, model, window_size, window_overlap, cache, completion_fn, prefilter, prompt_template
+        )
+        return toc if toc is not None else _fallback_toc(text, model)
+    if prefilter:
+        text = format_heading_candidates(find_heading_candidates(text))
+        prompt_template = HEADING_CANDIDATES_PROMPT_TEMPLATE
+    if window_size is not None and len(text) > window_size:
+        return create_windowed_toc(
+            text, model, window_size, window_overlap, cache, completion_fn, prompt_template
+        )
+    stats = current_stats()
+    with stage("create_toc"):
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(prompt_template, model, text)
+            toc = _cached_toc(cache, cache_key)
+            if toc is not None:
+                if stats is not None:
+                    stats.count("cache_hits")
+                return toc
+        try:
+            prompt = prompt_template.format(text=text)
+            start = time.perf_counter()
+            response = completion_fn(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+            )
+            if stats is not None:
+                stats.record_llm_call(model, time.perf_counter() - start, response)
+            toc = response.choices[0].message.content
+        except Exception as e:
+            print(f"Error during completion with model {model}: {e}")
+            return None
+        if cache_key is not None and toc is not None:
+            _store_toc(cache, cache_key, toc, len(prompt.encode("utf-8")))
+        return toc
+
+
+def _cached_toc(cache, cache_key):
+    """Looks the request up in the cache; a cache error counts as a miss instead of failing the request."""
+    try:
+        return cache.get(cache_key)
+    except sqlite3.Error as e:
+        print(f"Error reading the TOC cache: {e}")
+        return None
+
+
+def _store_toc(cache, cache_key, toc, request_size):
+    """Stores a generated TOC; a cache error is reported but the TOC is still returned by the caller."""
     try:
-        prompt = MARKDOWN_PROMPT_TEMPLATE.format(text=text)
-        response = completion(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
+        cache.put(cache_key, toc, request_size)
+    except sqlite3.Error as e:
+        print(f"Error writing the TOC cache: {e}")
+
+
+def _fallback_toc(text, model):
+    _report_fallback(model)
+    return create_heuristic_toc(text)
+
+
+def _report_fallback(model):
+    print(f"Falling back to the heuristic TOC after the failure of model {model}")
+    stats = current_stats()
+    if stats is not None:
+        stats.count("heuristic_fallbacks")
+
+
+def create_line_toc(
+    text,
+    model,
+    cache=None,
+    completion_fn=completion,
+    prefilter=False,
+    heuristic_fallback=False,
+):
+    """
+    Generates a line-numbered TOC: the lines are sent with their line numbers and the model
+    answers with the level and line number of each heading instead of copying the headings.
+
+    The answer is much shorter than a Markdown TOC, and the sections can be sliced at the
+    heading lines directly (see line_toc.line_toc_anchors and TocContentExtractor.extract_sections_at),
+    without searching for the headings in the text.
+
+    Args:
+        text: The original text to generate the TOC from.
+        model: The model to use. HEURISTIC_MODEL ("heuristic") picks the headings locally without an LLM.
+        cache: A TocCache to reuse TOCs of identical requests, or None.
+        completion_fn: The completion function (litellm's completion by default).
+        prefilter: If True, only the likely heading lines are sent (see create_toc).
+        heuristic_fallback: If True, the heuristic headings are returned when the model call fails, instead of None.
+
+    Returns:
+        A list of line_toc.LineHeading in text order.
+        Returns None if an error occurs.
+    """
+    if model != HEURISTIC_MODEL:
+        if prefilter:
+            numbered_lines = format_heading_candidates(find_heading_candidates(text))
+        else:
+            numbered_lines = format_numbered_lines(text)
+        response = create_toc(
+            numbered_lines,
+            model,
+            cache=cache,
+            completion_fn=completion_fn,
+            prompt_template=LINE_NUMBERS_PROMPT_TEMPLATE,
         )
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"Error during completion with model {model}: {e}")
+        if response is not None:
+            return parse_line_toc(response, text)
+        if not heuristic_fallback:
+            return None
+        _report_fallback(model)
+    return [LineHeading(level, line_number) for level, line_number, _ in heuristic_headings(text)]
+
+
+def split_text_into_windows(text, window_size=TOC_WINDOW_SIZE, overlap=TOC_WINDOW_OVERLAP):
+    """
+    Splits the text into overlapping windows, cutting at line breaks where possible.
+
+    Args:
+        text: The text to split.
+        window_size: The maximum number of characters per window.
+        overlap: The number of characters shared by consecutive windows.
+
+    Returns:
+        A list of windows (string list) in text order.
+    """
+    return list(iter_text_windows([text], window_size, overlap))
+
+
+def iter_text_windows(chunks, window_size=TOC_WINDOW_SIZE, overlap=TOC_WINDOW_OVERLAP):
+    """
+    Streaming version of split_text_into_windows for text that arrives in chunks (e.g. PDF pages).
+
+    Each window is yielded as soon as enough text has arrived, and the text before the
+    current window is dropped as the windows advance. The windows are the same as split_text_into_windows
+    would produce for the joined text.
+
+    Args:
+        chunks: An iterable of text chunks, in order.
+        window_size: The maximum number of characters per window.
+        overlap: The number of characters shared by consecutive windows.
+
+    Yields:
+        Windows (strings) in text order.
+    """
+    if overlap >= window_size:
+        raise ValueError("overlap must be smaller than window_size.")
+
+    chunks = iter(chunks)
+    exhausted = False
+    buffer = ""  # The text from buffer_start on
+    buffer_start = 0
+    start = 0
+    while True:
+        # Read until it is known whether the text extends past this window
+        while not exhausted and buffer_start + len(buffer) <= start + window_size:
+            chunk = next(chunks, None)
+            if chunk is None:
+                exhausted = True
+            else:
+                buffer += chunk
+        text_end = buffer_start + len(buffer)
+
+        end = min(start + window_size, text_end)
+        if end < text_end:
+            # Prefer to end the window at a line break in its second half
+            line_end = buffer.rfind(
+                "\n", start + window_size // 2 - buffer_start, end - buffer_start
+            )
+            if line_end >= 0 and line_end + buffer_start > 0:
+                end = line_end + buffer_start + 1
+        yield buffer[start - buffer_start : end - buffer_start]
+        if end >= text_end:
+            return
+        start = max(end - overlap, start + 1)
+        # Drop the consumed text only once it outgrows a window and half the buffer,
+        # so a text passed as one large chunk is not copied again for every window
+        if start - buffer_start > max(window_size, len(buffer) // 2):
+            buffer = buffer[start - buffer_start :]
+            buffer_start = start
+
+
+def _heading_key(toc_line):
+    """Returns the heading text of a TOC line, ignoring its level, width, case and spaces."""
+    heading = unicodedata.normalize("NFKC", toc_line.lstrip("#"))
+    return re.sub(r"[\s\u3000]+", "", heading.lower())
+
+
+def merge_tocs(partial_tocs):
+    """
+    Merges the TOCs generated for consecutive windows into a single ordered TOC.
+
+    Headings in the overlap of two windows appear at the end of one TOC and at the start
+    of the next, so the leading headings of each TOC that were already listed by the
+    previous TOC are dropped.
+
+    Args:
+        partial_tocs: The TOCs (Markdown strings) of each window, in text order.
+
+    Returns:
+        The merged TOC in Markdown format (string).
+    """
+    merged = []
+    previous_keys = set()
+    for partial_toc in partial_tocs:
+        toc_lines = [
+            line.strip()
+            for line in partial_toc.splitlines()
+            if re.match(r"^#{1,6}\s", line.strip())
+        ]
+        keys = [_heading_key(line) for line in toc_lines]
+        skip = 0
+        while skip < len(toc_lines) and keys[skip] in previous_keys:
+            skip += 1
+        merged.extend(toc_lines[skip:])
+        previous_keys = set(keys)
+    return "\n".join(merged)
+
+
+def create_windowed_toc(
+    text,
+    model,
+    window_size=TOC_WINDOW_SIZE,
+    window_overlap=TOC_WINDOW_OVERLAP,
+    cache=None,
+    completion_fn=completion,
+    prompt_template=MARKDOWN_PROMPT_TEMPLATE,
+):
+    """
+    Generates a TOC for text larger than the model context by requesting a partial TOC
+    for each overlapping window and merging them.
+
+    Args:
+        text: The original text to generate the TOC from.
+        model: The model to use.
+        window_size: The maximum number of characters per window.
+        window_overlap: The number of characters shared by consecutive windows.
+        cache: A TocCache to reuse the TOCs of unchanged windows, or None.
+        completion_fn: The completion function (litellm's completion by default).
+        prompt_template: The prompt template, with a {text} placeholder.
+
+    Returns:
+        The merged TOC in Markdown format (string).
+        Returns None if the TOC of any window could not be generated.
+    """
+    return create_streaming_toc(
+        [text], model, window_size, window_overlap, cache, completion_fn, prompt_template
+    )
+
+
+def create_streaming_toc(
+    chunks,
+    model,
+    window_size=TOC_WINDOW_SIZE,
+    window_overlap=TOC_WINDOW_OVERLAP,
+    cache=None,
+    completion_fn=completion,
+    prompt_template=MARKDOWN_PROMPT_TEMPLATE,
+):
+    """
+    Windowed TOC generation for text that arrives in chunks, such as the pages yielded by
+    pdf_text_extractor.iter_pdf_pages. The TOC of each window is requested as soon as
+    the window is complete, before the following chunks are read.
+
+    Args:
+        chunks: An iterable of text chunks, in order.
+        model: The model to use.
+        window_size: The maximum number of characters per window.
+        window_overlap: The number of characters shared by consecutive windows.
+        cache: A TocCache to reuse the TOCs of unchanged windows, or None.
+        completion_fn: The completion function (litellm's completion by default).
+        prompt_template: The prompt template, with a {text} placeholder.
+
+    Returns:
+        The merged TOC in Markdown format (string).
+        Returns None if the TOC of any window could not be generated.
+    """
+    partial_tocs = []
+    for window in iter_text_windows(chunks, window_size, window_overlap):
+        partial_toc = create_toc(
+            window, model, cache=cache, completion_fn=completion_fn, prompt_template=prompt_template
+        )
+        if partial_toc is None:
+            return None
+        partial_tocs.append(partial_toc)
+    return merge_tocs(partial_tocs)
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter for async LLM calls.
+
+    Args:
+        rate: The number of requests allowed per second on average.
+        capacity: The number of requests that may be sent in a burst.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Waits until a request may be sent."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+async def acreate_toc(
+    text,
+    model,
+    timeout=None,
+    rate_limiter=None,
+    completion_fn=acompletion,
+    cache=None,
+    prefilter=False,
+    heuristic_fallback=False,
+):
+    """
+    Async version of create_toc for a single text.
+
+    Args:
+        text: The original text to generate the TOC from.
+        model: The model to use.
+        timeout: The maximum number of seconds to wait for the model, or None.
+        rate_limiter: A TokenBucket shared by the calls that must respect the same quota, or None.
+        completion_fn: The async completion function (litellm's acompletion by default).
+        cache: A TocCache to reuse TOCs of identical requests, or None.
+            Cache hits do not consume the rate limit.
+        prefilter: If True, only the likely heading lines are sent (see create_toc).
+        heuristic_fallback: If True, a heuristic TOC is returned when the call fails or times out.
+
+    Returns:
+        The generated TOC in Markdown format (string).
+        Returns None if an error occurs or the call times out.
+    """
+    if model == HEURISTIC_MODEL:
+        return create_heuristic_toc(text)
+    if heuristic_fallback:
+        toc = await acreate_toc(
+            text, model, timeout, rate_limiter, completion_fn, cache, prefilter
+        )
+        return toc if toc is not None else _fallback_toc(text, model)
+    prompt_template = MARKDOWN_PROMPT_TEMPLATE
+    if prefilter:
+        text = format_heading_candidates(find_heading_candidates(text))
+        prompt_template = HEADING_CANDIDATES_PROMPT_TEMPLATE
+    stats = current_stats()
+    with stage("create_toc"):
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(prompt_template, model, text)
+            toc = _cached_toc(cache, cache_key)
+            if toc is not None:
+                if stats is not None:
+                    stats.count("cache_hits")
+                return toc
+        try:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            prompt = prompt_template.format(text=text)
+            start = time.perf_counter()
+            response = await asyncio.wait_for(
+                completion_fn(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                ),
+                timeout,
+            )
+            if stats is not None:
+                stats.record_llm_call(model, time.perf_counter() - start, response)
+            toc = response.choices[0].message.content
+        except asyncio.TimeoutError:
+            print(f"Timeout during completion with model {model} after {timeout} seconds")
+            return None
+        except Exception as e:
+            print(f"Error during completion with model {model}: {e}")
+            return None
+        if cache_key is not None and toc is not None:
+            _store_toc(cache, cache_key, toc, len(prompt.encode("utf-8")))
+        return toc
+
+
+async def acreate_tocs(
+    texts,
+    model,
+    max_concurrency=4,
+    timeout=None,
+    rate_limiter=None,
+    completion_fn=acompletion,
+    cache=None,
+):
+    """
+    Generates the TOCs of many texts (windows or whole documents) concurrently.
+
+    Args:
+        texts: The texts to generate TOCs from.
+        model: The model to use.
+        max_concurrency: The maximum number of calls in flight at once.
+        timeout: The maximum number of seconds to wait for each call, or None.
+        rate_limiter: A TokenBucket limiting the request rate, or None.
+        completion_fn: The async completion function (litellm's acompletion by default).
+        cache: A TocCache to reuse TOCs of identical requests, or None.
+
+    Returns:
+        A list of TOCs in the same order as texts; failed calls are None.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(text):
+        async with semaphore:
+            return await acreate_toc(
+                text, model, timeout, rate_limiter, completion_fn, cache
+            )
+
+    return await asyncio.gather(*(run(text) for text in texts))
+
+
+async def acreate_windowed_toc(
+    text,
+    model,
+    window_size=TOC_WINDOW_SIZE,
+    window_overlap=TOC_WINDOW_OVERLAP,
+    max_concurrency=4,
+    timeout=None,
+    rate_limiter=None,
+    completion_fn=acompletion,
+    cache=None,
+):
+    """
+    Async version of create_windowed_toc that requests the partial TOCs concurrently.
+
+    Args:
+        text: The original text to generate the TOC from.
+        model: The model to use.
+        window_size: The maximum number of characters per window.
+        window_overlap: The number of characters shared by consecutive windows.
+        max_concurrency: The maximum number of calls in flight at once.
+        timeout: The maximum number of seconds to wait for each call, or None.
+        rate_limiter: A TokenBucket limiting the request rate, or None.
+        completion_fn: The async completion function (litellm's acompletion by default).
+        cache: A TocCache to reuse the TOCs of unchanged windows, or None.
+
+    Returns:
+        The merged TOC in Markdown format (string).
+        Returns None if the TOC of any window could not be generated.
+    """
+    windows = split_text_into_windows(text, window_size, window_overlap)
+    partial_tocs = await acreate_tocs(
+        windows, model, max_concurrency, timeout, rate_limiter, completion_fn, cache
+    )
+    if any(partial_toc is None for partial_toc in partial_tocs):
+        return None
+    return merge_tocs(partial_tocs)
+
+
+async def acreate_streaming_toc(
+    chunks,
+    model,
+    window_size=TOC_WINDOW_SIZE,
+    window_overlap=TOC_WINDOW_OVERLAP,
+    max_concurrency=4,
+    timeout=None,
+    rate_limiter=None,
+    completion_fn=acompletion,
+    cache=None,
+):
+    """
+    Async version of create_streaming_toc. Chunks are read in a worker thread, so the
+    requests for completed windows run while later chunks (e.g. PDF pages) are still being decoded.
+
+    Args:
+        chunks: An iterable of text chunks, in order.
+        model: The model to use.
+        window_size: The maximum number of characters per window.
+        window_overlap: The number of characters shared by consecutive windows.
+        max_concurrency: The maximum number of calls in flight at once.
+        timeout: The maximum number of seconds to wait for each call, or None.
+        rate_limiter: A TokenBucket limiting the request rate, or None.
+        completion_fn: The async completion function (litellm's acompletion by default).
+        cache: A TocCache to reuse the TOCs of unchanged windows, or None.
+
+    Returns:
+        The merged TOC in Markdown format (string).
+        Returns None if the TOC of any window could not be generated.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    windows = iter_text_windows(chunks, window_size, window_overlap)
+    tasks = []
+    while True:
+        # A slot is taken before the next window is read, so a slow model also slows down
+        # the reader and at most max_concurrency windows are held in memory
+        await semaphore.acquire()
+        window = await asyncio.to_thread(next, windows, None)
+        if window is None:
+            semaphore.release()
+            break
+        task = asyncio.ensure_future(
+            acreate_toc(window, model, timeout, rate_limiter, completion_fn, cache)
+        )
+        task.add_done_callback(lambda _: semaphore.release())
+        tasks.append(task)
+
+    partial_tocs = await asyncio.gather(*tasks)
+    if any(partial_toc is None for partial_toc in partial_tocs):
         return None
+    return merge_tocs(partial_tocs)
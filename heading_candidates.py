@@ -0,0 +1,88 @@
+import re
+import unicodedata
+
+# Lines longer than this (in characters, without spaces) are never headings
+MAX_HEADING_LENGTH = 60
+
+_NUMBERING = re.compile(
+    r"""^(
+        第\s*[0-9一二三四五六七八九十百千]+\s*[章節部編話条項]  # 第1章, 第三節
+      | [0-9]+\s*\.(?:\s*[0-9]+\s*\.)*(?![0-9])               # 2. / 2.1. (not 3.5)
+      | (?:chapter|section|part|appendix)\b                   # Chapter 3
+      | [ivx]+[.)]\s                                          # iv. / iv)
+      | \(?[0-9]+\)                                           # (3) / 3)
+    )""",
+    re.VERBOSE,
+)
+_SENTENCE_END = tuple("。．！？!?、，,;；")
+
+
+def is_spaced_glyphs(line):
+    """Returns True for headings spelled out with spaced glyphs, e.g. "旅 立 ち"."""
+    tokens = line.split()
+    if len(tokens) < 3:
+        return False
+    return sum(len(token) == 1 for token in tokens) >= 0.8 * len(tokens)
+
+
+def heading_score(line, previous_blank=False, next_blank=False):
+    """
+    Scores how likely a line is a heading from cheap features:
+    length, numbering ("第1章", "2.1.", "Chapter 3"), spaced glyphs, Markdown marks,
+    sentence punctuation at the end and blank lines around it.
+
+    Args:
+        line: The line of text.
+        previous_blank: Whether the previous line is blank.
+        next_blank: Whether the next line is blank.
+
+    Returns:
+        An integer score; find_heading_candidates keeps lines scoring 2 or more by default.
+    """
+    stripped = unicodedata.normalize("NFKC", line).strip()
+    compact = "".join(stripped.split())
+    if not compact or len(compact) > MAX_HEADING_LENGTH:
+        return 0
+
+    score = 1
+    numbered = bool(_NUMBERING.match(stripped.lower()))
+    if stripped.startswith("#"):
+        score += 2
+    if numbered:
+        score += 2
+    if is_spaced_glyphs(stripped):
+        score += 2
+    if previous_blank or next_blank:
+        score += 1
+    if compact.endswith(_SENTENCE_END) or (compact.endswith(".") and not numbered):
+        score -= 2
+    words = stripped.split()
+    if 2 <= len(words) <= 10 and all(word[0].isupper() for word in words if word[0].isalpha()):
+        score += 1
+    return score
+
+
+def find_heading_candidates(text, min_score=2):
+    """
+    Picks out the lines of a text that are likely headings (see heading_score).
+
+    Args:
+        text: The text of the document.
+        min_score: The minimum score of a candidate; lower values trade prompt size for recall.
+
+    Returns:
+        A list of (line_number, line) tuples, with 1-based line numbers, in text order.
+    """
+    lines = text.splitlines()
+    candidates = []
+    for index, line in enumerate(lines):
+        previous_blank = index == 0 or not lines[index - 1].strip()
+        next_blank = index + 1 == len(lines) or not lines[index + 1].strip()
+        if heading_score(line, previous_blank, next_blank) >= min_score:
+            candidates.append((index + 1, line.strip()))
+    return candidates
+
+
+def format_heading_candidates(candidates):
+    """Formats heading candidates for the prompt, one "line_number: line" per line."""
+    return "\n".join(f"{line_number}: {line}" for line_number, line in candidates)
@@ -0,0 +1,81 @@
+import argparse
+import pickle
+
+from heading_locator import HeadingAutomaton, HeadingLocator
+from toc_content_extractor import TocContentExtractor
+
+
+class HeadingIndex:
+    """
+    A heading automaton built once from the TOCs of a corpus (e.g. documents generated from
+    the same templates) and shared by the extractions of all its documents.
+
+    Each document is scanned once against the union of the known headings and their trimmed
+    search variants. Headings that are not in the index are still found, by a direct search.
+
+    Example:
+        index = HeadingIndex(known_tocs)
+        index.save("headings.index")
+        # In a worker process
+        extractor = TocContentExtractor(heading_index=HeadingIndex.load("headings.index"))
+
+    Args:
+        toc_texts: The TOC texts (Markdown) of the known documents.
+        toc_search_min_length: The toc_search_min_length of the extractors using the index.
+        toc_max_level: The toc_max_level of the extractors using the index.
+    """
+
+    def __init__(self, toc_texts, toc_search_min_length=6, toc_max_level=3):
+        self.toc_search_min_length = toc_search_min_length
+        self.toc_max_level = toc_max_level
+        extractor = TocContentExtractor(toc_search_min_length, toc_max_level)
+        patterns = []
+        for toc_text in toc_texts:
+            toc_list = extractor.generate_filtered_toc(toc_text.splitlines(), toc_max_level)
+            patterns.extend(extractor.heading_patterns(toc_list))
+        self.automaton = HeadingAutomaton(patterns)
+
+    def __len__(self):
+        """The number of distinct search strings in the index."""
+        return len(self.automaton.patterns)
+
+    def locator(self, normalized_content):
+        """Scans a normalized document once and returns a HeadingLocator over it."""
+        return HeadingLocator(None, normalized_content, self.automaton)
+
+    def save(self, path):
+        """Writes the index to a file, so other processes can load it without rebuilding it."""
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads an index written by save(). The file is a pickle, so only load trusted files.
+        """
+        with open(path, "rb") as f:
+            index = pickle.load(f)
+        if not isinstance(index, cls):
+            raise TypeError(f"{path} does not contain a {cls.__name__}.")
+        return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds a heading index from known TOC files.")
+    parser.add_argument("output_path")
+    parser.add_argument("toc_paths", nargs="+", help="TOC files, e.g. the .toc.md outputs of batch_process.py.")
+    parser.add_argument("--toc-search-min-length", type=int, default=6)
+    parser.add_argument("--toc-max-level", type=int, default=3)
+    args = parser.parse_args()
+
+    toc_texts = []
+    for toc_path in args.toc_paths:
+        with open(toc_path, encoding="utf-8") as f:
+            toc_texts.append(f.read())
+    index = HeadingIndex(toc_texts, args.toc_search_min_length, args.toc_max_level)
+    index.save(args.output_path)
+    print(f"Indexed {len(index)} search strings from {len(toc_texts)} TOCs.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+from bisect import bisect_left
+from collections import deque
+from heapq import heappop, heappush
+
+
+class HeadingAutomaton:
+    """
+    Aho-Corasick automaton over normalized heading strings.
+
+    All headings are located in a single pass over the text, so the cost of
+    finding every heading is linear in the text length plus the number of hits.
+    """
+
+    def __init__(self, patterns):
+        # Keep the insertion order and drop empty strings and duplicates
+        self.patterns = list(dict.fromkeys(p for p in patterns if p))
+        self.pattern_indexes = {pattern: index for index, pattern in enumerate(self.patterns)}
+        self._lengths = [len(pattern) for pattern in self.patterns]
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._output[state].append(index)
+
+        # Build the failure links breadth-first
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = (
+                    self._output[next_state] + self._output[self._fail[next_state]]
+                )
+
+    def scan(self, text):
+        """
+        Scans the text once and collects the start positions of every pattern.
+
+        Args:
+            text: The (normalized) text to scan.
+
+        Returns:
+            A dictionary mapping each pattern to the sorted list of its start positions.
+        """
+        hits = self.scan_hits(text)
+        return {pattern: hits.get(index, []) for index, pattern in enumerate(self.patterns)}
+
+    def scan_hits(self, text):
+        """
+        Like scan(), but only for the patterns that occur, keyed by their index in self.patterns.
+        The cost does not depend on the number of patterns that do not occur.
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        lengths = self._lengths
+        hits = {}
+
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                for index in output[state]:
+                    start = position - lengths[index] + 1
+                    positions = hits.get(index)
+                    if positions is None:
+                        hits[index] = [start]
+                    else:
+                        positions.append(start)
+
+        return hits
+
+
+class HeadingLocator:
+    """
+    Answers "where is the first occurrence of this heading at or after a position"
+    from the positions collected by one HeadingAutomaton scan.
+    A prebuilt automaton can be passed instead of the patterns.
+    """
+
+    def __init__(self, patterns, text, automaton=None):
+        self.text = text
+        if automaton is None:
+            automaton = HeadingAutomaton(patterns)
+        self._pattern_indexes = automaton.pattern_indexes
+        self._hits = automaton.scan_hits(text)
+
+    def find(self, pattern, start=0):
+        """
+        Returns the first start position of pattern at or after start, or None.
+        Patterns that were not registered are searched directly in the text.
+        """
+        if not pattern:
+            return start
+        pattern_index = self._pattern_indexes.get(pattern)
+        if pattern_index is None:
+            found = self.text.find(pattern, start)
+            return found if found >= 0 else None
+        positions = self._hits.get(pattern_index, ())
+        index = bisect_left(positions, start)
+        if index < len(positions):
+            return positions[index]
+        return None
+
+
+def _best_approximate_match(window, pattern):
+    """
+    Finds the substring of window closest to pattern in edit distance (Sellers' algorithm).
+
+    Returns:
+        A tuple (distance, start) for the best match; ties keep the earliest match.
+    """
+    m = len(pattern)
+    costs = list(range(m + 1))
+    starts = [0] * (m + 1)
+    best = (costs[m], 0)
+    for j, char in enumerate(window):
+        new_costs = [0] * (m + 1)
+        new_starts = [j + 1] * (m + 1)
+        for i in range(1, m + 1):
+            # Substitution (or match), deletion from the pattern, insertion into the pattern
+            cost = costs[i - 1] + (pattern[i - 1] != char)
+            start = starts[i - 1]
+            if new_costs[i - 1] + 1 < cost:
+                cost = new_costs[i - 1] + 1
+                start = new_starts[i - 1]
+            if costs[i] + 1 < cost:
+                cost = costs[i] + 1
+                start = starts[i]
+            new_costs[i] = cost
+            new_starts[i] = start
+        costs, starts = new_costs, new_starts
+        if costs[m] < best[0]:
+            best = (costs[m], starts[m])
+    return best
+
+
+def find_approximate(text, pattern, start=0, max_distance=2):
+    """
+    Returns the start position of the first approximate occurrence of pattern at or after start,
+    or None if there is no occurrence within max_distance edits.
+
+    An exact occurrence is preferred. Otherwise candidates are filtered by splitting the pattern
+    into max_distance + 1 pieces, at least one of which must occur exactly in any match
+    with at most max_distance edits. Only the regions around those hits are verified,
+    in text order, and the best match in the first region that verifies is returned.
+    """
+    found = text.find(pattern, start)
+    if found >= 0 or max_distance <= 0:
+        return found if found >= 0 else None
+
+    m = len(pattern)
+    piece_count = max_distance + 1
+    bounds = [m * index // piece_count for index in range(piece_count + 1)]
+    pieces = [
+        (pattern[bounds[index] : bounds[index + 1]], bounds[index])
+        for index in range(piece_count)
+        if bounds[index] < bounds[index + 1]
+    ]
+
+    # Walk the piece hits in text order so the first verified candidate is the earliest
+    heap = []
+    for piece, offset in pieces:
+        hit = text.find(piece, start)
+        if hit >= 0:
+            heappush(heap, (hit - offset, hit, piece, offset))
+
+    while heap:
+        estimate, hit, piece, offset = heappop(heap)
+        window_start = max(estimate - max_distance, start)
+        window_end = min(len(text), estimate + m + max_distance)
+        distance, match_start = _best_approximate_match(
+            text[window_start:window_end], pattern
+        )
+        if distance <= max_distance:
+            return window_start + match_start
+        next_hit = text.find(piece, hit + 1)
+        if next_hit >= 0:
+            heappush(heap, (next_hit - offset, next_hit, piece, offset))
+    return None
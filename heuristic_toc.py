@@ -0,0 +1,133 @@
+from collections import Counter
+import re
+import unicodedata
+
+from heading_candidates import is_spaced_glyphs, find_heading_candidates
+
+# Lines repeated this often are running headers or footers, not headings
+MAX_HEADING_REPEATS = 2
+
+_MARKDOWN = re.compile(r"^(#{1,6})\s+(.*)$")
+# Every number ends with a dot, and no digit follows the last one, so "3.5 kg" is not a heading number
+_DECIMAL = re.compile(r"^([0-9]+\s*\.(?:\s*[0-9]+\s*\.)*)(?![0-9])")
+_CHAPTER = re.compile(r"^第\s*[0-9一二三四五六七八九十百千]+\s*([章節部編話条項])")
+_ENGLISH = re.compile(r"^(part|chapter|section|appendix)\b")
+_PARENTHESIZED = re.compile(r"^\(?[0-9]+\)")
+_ROMAN = re.compile(r"^[ivx]+[.)]\s")
+
+# The usual nesting of the Japanese and English division names
+_DIVISION_ORDER = {"部": 0, "編": 0, "part": 0, "章": 1, "chapter": 1, "appendix": 1, "節": 2, "section": 2, "話": 2, "条": 3, "項": 4}
+
+
+def heading_style(line):
+    """
+    Classifies the numbering of a heading line.
+
+    Returns:
+        A tuple (family, depth): family is "markdown", "decimal" ("1.", "2.1."),
+        a division name ("章", "節", "chapter", ...), "parenthesized", "roman" or "plain";
+        depth is the number of decimal components (or the "#" count), 1 otherwise.
+    """
+    normalized = unicodedata.normalize("NFKC", line).strip()
+    markdown = _MARKDOWN.match(normalized)
+    if markdown:
+        return "markdown", len(markdown.group(1))
+    lowered = normalized.lower()
+    decimal = _DECIMAL.match(lowered)
+    if decimal:
+        return "decimal", len(re.findall(r"[0-9]+", decimal.group(1)))
+    division = _CHAPTER.match(normalized) or _ENGLISH.match(lowered)
+    if division:
+        return division.group(1), 1
+    if _PARENTHESIZED.match(lowered):
+        return "parenthesized", 1
+    if _ROMAN.match(lowered):
+        return "roman", 1
+    return "plain", 1
+
+
+def _heading_text(line):
+    """The heading text of a line, without Markdown marks and with spaced glyphs joined ("旅 立 ち" -> "旅立ち")."""
+    line = line.strip()
+    markdown = _MARKDOWN.match(line)
+    if markdown:
+        line = markdown.group(2).strip()
+    if is_spaced_glyphs(line):
+        return "".join(line.split())
+    return line
+
+
+def assign_heading_levels(styles):
+    """
+    Assigns a level to each heading style from the structure of the document.
+
+    Markdown headings keep their level. Division names follow their usual nesting
+    (部 > 章 > 節, part > chapter > section). The other families are ranked by first
+    appearance, and decimal numbering adds one level per component (1. > 1.1. > 1.1.1.).
+
+    Args:
+        styles: The (family, depth) of each heading, in document order.
+
+    Returns:
+        A list of levels (1 to 6), one per heading.
+    """
+    families = list(dict.fromkeys(family for family, _ in styles if family != "markdown"))
+    divisions = sorted((f for f in families if f in _DIVISION_ORDER), key=_DIVISION_ORDER.get)
+    others = [f for f in families if f not in _DIVISION_ORDER]
+    spans = Counter()
+    for family, depth in styles:
+        spans[family] = max(spans[family], depth)
+
+    base_levels = {}
+    level = 1
+    # Divisions are outermost: a document numbered by chapters nests everything else inside them
+    for family in divisions + others:
+        base_levels[family] = level
+        level += spans[family]
+
+    levels = []
+    for family, depth in styles:
+        if family == "markdown":
+            levels.append(depth)
+        else:
+            levels.append(min(6, base_levels[family] + depth - 1))
+    return levels
+
+
+def heuristic_headings(text, min_score=2):
+    """
+    Picks the headings of a text from its heading candidates (see heading_candidates.find_heading_candidates)
+    and infers their levels from their numbering. Lines repeated more than MAX_HEADING_REPEATS times
+    (running headers and footers) are left out.
+
+    Args:
+        text: The text of the document.
+        min_score: The minimum heading score of a line.
+
+    Returns:
+        A list of (level, line_number, line) tuples, with 1-based line numbers, in text order.
+    """
+    candidates = find_heading_candidates(text, min_score)
+    repeats = Counter(line for _, line in candidates)
+    candidates = [(number, line) for number, line in candidates if repeats[line] <= MAX_HEADING_REPEATS]
+    levels = assign_heading_levels([heading_style(line) for _, line in candidates])
+    return [(level, number, line) for level, (number, line) in zip(levels, candidates)]
+
+
+def create_heuristic_toc(text, min_score=2):
+    """
+    Generates a TOC without an LLM, from the headings found by heuristic_headings.
+
+    It takes milliseconds, so it suits well-structured documents, and serves as the fallback
+    of create_toc when the model call fails.
+
+    Args:
+        text: The text of the document.
+        min_score: The minimum heading score of a line.
+
+    Returns:
+        The TOC in Markdown format (string), as consumed by TocContentExtractor.
+    """
+    return "\n".join(
+        "#" * level + " " + _heading_text(line) for level, _, line in heuristic_headings(text, min_score)
+    )
@@ -0,0 +1,81 @@
+import re
+from typing import NamedTuple
+
+from heading_candidates import format_heading_candidates
+
+# One heading per line: the level (1-6, or "#" marks) and the line number, e.g. "2 41".
+# Tolerates list bullets, "L41", separators and a trailing copy of the heading text.
+# The level must be followed by a space, "." or ",", but not ":", so echoed "41: line" prompt lines
+# (including "3: 1. Intro", whose text starts with a number) are not read as headings.
+_ENTRY = re.compile(
+    r"^\s*(?:[-*]\s*)?(#{1,6}|[1-6])(?![0-9])(?:\s*[.,]\s*|\s+)L?([0-9]+)\b", re.IGNORECASE
+)
+
+
+class LineHeading(NamedTuple):
+    """A heading of a line-numbered TOC: its level and the 1-based number of its line."""
+
+    level: int
+    line_number: int
+
+
+def format_numbered_lines(text):
+    """
+    Formats the non-blank lines of a text for the line-numbered TOC prompt, one "line_number: line"
+    per line. Line numbers are 1-based and count blank lines, as in text.splitlines().
+    """
+    return format_heading_candidates(
+        (index + 1, line.strip()) for index, line in enumerate(text.splitlines()) if line.strip()
+    )
+
+
+def parse_line_toc(response, text):
+    """
+    Parses a line-numbered TOC returned by the model.
+
+    Lines that do not follow the format, and line numbers that are out of range or point to
+    blank lines, are skipped. Headings are returned in text order, without duplicates.
+
+    Args:
+        response: The model output, one "level line_number" per heading.
+        text: The text whose lines were numbered.
+
+    Returns:
+        A list of LineHeading.
+    """
+    lines = text.splitlines()
+    headings = {}
+    for entry in response.splitlines():
+        match = _ENTRY.match(entry)
+        if not match:
+            continue
+        level, line_number = match.groups()
+        line_number = int(line_number)
+        if not 1 <= line_number <= len(lines) or not lines[line_number - 1].strip():
+            continue
+        level = len(level) if level.startswith("#") else int(level)
+        headings.setdefault(line_number, LineHeading(level, line_number))
+    return [headings[line_number] for line_number in sorted(headings)]
+
+
+def line_toc_anchors(headings, text):
+    """
+    Resolves line-numbered headings to (level, heading, start) anchors, where start is the
+    offset of the heading line in text. Pass them to TocContentExtractor.extract_sections_at.
+    """
+    lines = text.splitlines(keepends=True)
+    line_starts = [0]
+    for line in lines:
+        line_starts.append(line_starts[-1] + len(line))
+    return [
+        (heading.level, lines[heading.line_number - 1].strip(), line_starts[heading.line_number - 1])
+        for heading in headings
+    ]
+
+
+def line_toc_to_markdown(headings, text):
+    """Formats line-numbered headings as a Markdown TOC, with the heading text of their lines."""
+    lines = text.splitlines()
+    return "\n".join(
+        "#" * heading.level + " " + lines[heading.line_number - 1].strip() for heading in headings
+    )
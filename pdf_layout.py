@@ -0,0 +1,169 @@
+from collections import Counter
+import io
+import re
+from statistics import median
+from typing import NamedTuple
+
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LTChar, LTContainer, LTText, LTTextBox, LTTextLine
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+
+from heading_candidates import MAX_HEADING_LENGTH
+from pdf_text_extractor import _make_laparams
+
+_BOLD_FONT = re.compile(r"bold|black|heavy|semibold|demi|-w[6-9]\b", re.IGNORECASE)
+
+
+class TextLine(NamedTuple):
+    """A text line of a PDF with its font statistics and its offsets in the extracted text."""
+
+    text: str  # The line without its trailing newline
+    start: int  # Offsets of the line in the text returned by extract_layout_from_pdf
+    end: int
+    page: int  # 0-based page index
+    font_size: float  # The median character size, in points
+    bold: bool  # True if most characters use a bold font
+    fontname: str  # The most common font of the line
+    x0: float  # The left and top coordinates of the line on the page
+    top: float
+
+
+class LayoutHeading(NamedTuple):
+    """A heading found from the layout, anchored at its offset in the extracted text."""
+
+    level: int
+    heading: str
+    start: int
+
+
+class _LayoutTextConverter(TextConverter):
+    """
+    TextConverter that also records every text line with its font statistics.
+    The text it writes is the same as TextConverter's, so offsets refer to extract_text_from_pdf's text.
+    """
+
+    def __init__(self, rsrcmgr, outfp, laparams):
+        super().__init__(rsrcmgr, outfp, laparams=laparams)
+        self.position = 0
+        self.page_index = 0
+        self.lines = []
+
+    def write_text(self, text):
+        super().write_text(text)
+        self.position += len(text)
+
+    def receive_layout(self, ltpage):
+        def render(item):
+            if isinstance(item, LTTextLine):
+                start = self.position
+                chars = []
+                for child in item:
+                    if isinstance(child, LTChar):
+                        chars.append(child)
+                    self.write_text(child.get_text())
+                self._record_line(item, start, chars)
+            elif isinstance(item, LTContainer):
+                for child in item:
+                    render(child)
+            elif isinstance(item, LTText):
+                self.write_text(item.get_text())
+            if isinstance(item, LTTextBox):
+                self.write_text("\n")
+
+        render(ltpage)
+        self.write_text("\f")
+        self.page_index += 1
+
+    def _record_line(self, item, start, chars):
+        if not chars:
+            return
+        text = item.get_text().rstrip("\n")
+        fontnames = Counter(char.fontname for char in chars)
+        bold_count = sum(count for name, count in fontnames.items() if _BOLD_FONT.search(name))
+        self.lines.append(
+            TextLine(
+                text,
+                start,
+                start + len(text),
+                self.page_index,
+                round(median(char.size for char in chars), 1),
+                bold_count * 2 > len(chars),
+                fontnames.most_common(1)[0][0],
+                item.x0,
+                item.y1,
+            )
+        )
+
+
+def extract_layout_from_pdf(pdf_path):
+    """
+    Extracts the text of a PDF file together with the layout of its text lines.
+
+    Args:
+        pdf_path: Path to the PDF file.
+
+    Returns:
+        A tuple (text, lines): text is the same as extract_text_from_pdf returns, and lines is
+        a list of TextLine with the font statistics and offsets in text of every line, in text order.
+    """
+    with open(pdf_path, 'rb') as f:
+        rsrcmgr = PDFResourceManager()
+        output_string = io.StringIO()
+        converter = _LayoutTextConverter(rsrcmgr, output_string, _make_laparams())
+        interpreter = PDFPageInterpreter(rsrcmgr, converter)
+        for page in PDFPage.get_pages(f):
+            interpreter.process_page(page)
+        text = output_string.getvalue()
+        converter.close()
+        output_string.close()
+        return text, converter.lines
+
+
+def body_font_size(lines):
+    """Returns the font size used by most characters (the size of the body text)."""
+    sizes = Counter()
+    for line in lines:
+        sizes[line.font_size] += len(line.text)
+    return sizes.most_common(1)[0][0] if sizes else 0
+
+
+def detect_layout_headings(lines, size_ratio=1.15, max_length=MAX_HEADING_LENGTH):
+    """
+    Finds the headings of a PDF from font metrics: lines set larger than the body text,
+    or in bold at the body size, and short enough to be headings.
+
+    Levels follow the font size: the largest heading size is level 1, the next one level 2,
+    and so on; bold lines at the body size come last. Levels are capped at 6.
+
+    Args:
+        lines: The TextLine list returned by extract_layout_from_pdf.
+        size_ratio: How much larger than the body text a line must be to count as a heading.
+        max_length: The maximum length (without spaces) of a heading.
+
+    Returns:
+        A list of LayoutHeading, in text order.
+    """
+    body_size = body_font_size(lines)
+    candidates = []
+    for line in lines:
+        compact = "".join(line.text.split())
+        if not compact or len(compact) > max_length:
+            continue
+        if line.font_size >= body_size * size_ratio:
+            candidates.append((line, line.font_size))
+        elif line.bold and line.font_size >= body_size:
+            # Below every larger size
+            candidates.append((line, 0))
+
+    sizes = sorted({size for _, size in candidates}, reverse=True)
+    levels = {size: min(6, index + 1) for index, size in enumerate(sizes)}
+    return [
+        LayoutHeading(levels[size], line.text.strip(), line.start)
+        for line, size in candidates
+    ]
+
+
+def layout_headings_to_toc(headings):
+    """Formats layout headings as a Markdown TOC, as consumed by TocContentExtractor."""
+    return "\n".join("#" * heading.level + " " + heading.heading for heading in headings)
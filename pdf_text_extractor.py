@@ -0,0 +1,178 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+
+from pipeline_stats import current_stats, stage
+
+
+def _make_laparams():
+    laparams = LAParams()
+    # Setting to recognize vertical writing as such.
+    laparams.detect_vertical = True
+    return laparams
+
+
+def extract_text_from_pdf(pdf_path):
+    """
+    Function to extract text from a PDF file.
+
+    Args:
+        pdf_path: Path to the PDF file.
+
+    Returns:
+        Extracted text (string).
+    """
+    with open(pdf_path, 'rb') as f, stage("pdf_parse") as stats:
+        parser = PDFParser(f)
+        doc = PDFDocument(parser)
+        rsrcmgr = PDFResourceManager()
+        laparams = _make_laparams()
+        output_string = io.StringIO()
+        converter = TextConverter(rsrcmgr, output_string, laparams=laparams)
+        interpreter = PDFPageInterpreter(rsrcmgr, converter)
+
+        for page in PDFPage.create_pages(doc):
+            interpreter.process_page(page)
+            if stats is not None:
+                stats.count("pdf_pages")
+
+        text = output_string.getvalue()
+        converter.close()
+        output_string.close()
+        return text
+
+
+def _iter_page_texts(f, pagenos=None):
+    """Yields the text of each page of an open PDF file (optionally only the given page numbers)."""
+    rsrcmgr = PDFResourceManager()
+    output_string = io.StringIO()
+    converter = TextConverter(rsrcmgr, output_string, laparams=_make_laparams())
+    interpreter = PDFPageInterpreter(rsrcmgr, converter)
+    stats = current_stats()
+    try:
+        for page in PDFPage.get_pages(f, pagenos=pagenos):
+            if stats is None:
+                interpreter.process_page(page)
+            else:
+                # Only the decoding is timed, not the time the consumer holds the generator
+                with stats.stage("pdf_parse"):
+                    interpreter.process_page(page)
+                stats.count("pdf_pages")
+            page_text = output_string.getvalue()
+            output_string.seek(0)
+            output_string.truncate()
+            yield page_text
+    finally:
+        converter.close()
+        output_string.close()
+
+
+def iter_pdf_pages(pdf_path):
+    """
+    Extracts the text of a PDF file page by page, yielding each page as soon as it is decoded.
+
+    Only the current page is held in memory, so downstream steps (e.g. create_toc.create_streaming_toc)
+    can start on the first pages while later pages are still being parsed.
+
+    Args:
+        pdf_path: Path to the PDF file.
+
+    Yields:
+        The text of each page (string), in page order.
+    """
+    with open(pdf_path, 'rb') as f:
+        yield from _iter_page_texts(f)
+
+
+def iter_pdf_page_batches(pdf_path, batch_size=10):
+    """
+    Yields the page texts of a PDF file in batches, so peak memory is bounded by the batch size.
+
+    Args:
+        pdf_path: Path to the PDF file.
+        batch_size: The number of pages per batch.
+
+    Yields:
+        Lists of page texts (string list), in page order.
+    """
+    pages = iter_pdf_pages(pdf_path)
+    while True:
+        batch = list(islice(pages, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def count_pdf_pages(pdf_path):
+    """
+    Returns the number of pages of a PDF file.
+    The page tree is walked like PDFPage.get_pages does; its /Count entry is not trusted.
+    """
+    with open(pdf_path, 'rb') as f:
+        doc = PDFDocument(PDFParser(f))
+        return sum(1 for _ in PDFPage.create_pages(doc))
+
+
+def _extract_page_range(pdf_path, start, end):
+    """
+    Extracts the text of pages [start, end) of a PDF file, one string per page.
+    Runs in a worker process, so the file is opened here.
+    """
+    with open(pdf_path, 'rb') as f:
+        return list(_iter_page_texts(f, pagenos=range(start, end)))
+
+
+def extract_pages_from_pdf_parallel(pdf_path, max_workers=None):
+    """
+    Extracts the text of each page of a PDF file using a pool of worker processes.
+
+    Each worker opens the file itself and handles a contiguous range of pages.
+
+    Args:
+        pdf_path: Path to the PDF file.
+        max_workers: The number of worker processes (defaults to the number of CPUs).
+
+    Returns:
+        A list of page texts (string list) in page order.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    page_count = count_pdf_pages(pdf_path)
+    if page_count == 0:
+        return []
+
+    # A few ranges per worker keeps the pool busy when pages differ in cost
+    range_count = min(page_count, max_workers * 4)
+    bounds = [page_count * index // range_count for index in range(range_count + 1)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor, stage("pdf_parse") as stats:
+        if stats is not None:
+            stats.count("pdf_pages", page_count)
+        futures = [
+            executor.submit(_extract_page_range, pdf_path, start, end)
+            for start, end in zip(bounds, bounds[1:])
+        ]
+        page_texts = []
+        for future in futures:
+            page_texts.extend(future.result())
+    return page_texts
+
+
+def extract_text_from_pdf_parallel(pdf_path, max_workers=None):
+    """
+    Parallel version of extract_text_from_pdf.
+
+    Args:
+        pdf_path: Path to the PDF file.
+        max_workers: The number of worker processes (defaults to the number of CPUs).
+
+    Returns:
+        Extracted text (string), with pages in order.
+    """
+    return "".join(extract_pages_from_pdf_parallel(pdf_path, max_workers))
@@ -0,0 +1,136 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+
+_active_stats = ContextVar("pipeline_stats", default=None)
+
+
+class PipelineStats:
+    """
+    Durations and counters of a pipeline run, collected while it is active (see instrument()).
+
+    Attributes:
+        durations: Seconds spent per stage: "pdf_parse", "create_toc", "extract" and
+            "normalize" (part of "extract"). Concurrent calls (e.g. acreate_tocs) are summed.
+        counters: Totals per name: "pdf_pages", "search_attempts", "trims", "scanned_chars"
+            (characters of the normalized text examined by heading searches), "llm_calls",
+            "prompt_tokens", "completion_tokens", "cache_hits".
+        headings: One record per TOC heading of each extraction, with 'heading',
+            'attempts' (searches for the heading), 'trims' (retries with a trimmed heading)
+            and 'matched'.
+        llm_calls: One record per LLM call, with 'model', 'latency', 'prompt_tokens'
+            and 'completion_tokens'.
+
+    Args:
+        callback: A function called as callback(event, data) for every record, where event is
+            "duration", "count", "heading" or "llm_call" and data is a dictionary; or None.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.durations = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.headings = []
+        self.llm_calls = []
+
+    @contextmanager
+    def stage(self, name):
+        """Measures the duration of the with-block as the given stage."""
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_duration(name, time.perf_counter() - start)
+
+    def add_duration(self, name, seconds):
+        self.durations[name] += seconds
+        self._emit("duration", name=name, seconds=seconds)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+        self._emit("count", name=name, value=value)
+
+    def record_heading(self, heading, attempts, matched):
+        record = {
+            "heading": heading,
+            "attempts": attempts,
+            "trims": attempts - 1,
+            "matched": matched,
+        }
+        self.headings.append(record)
+        self.counters["search_attempts"] += attempts
+        self.counters["trims"] += attempts - 1
+        self._emit("heading", **record)
+
+    def record_llm_call(self, model, latency, response):
+        """Records an LLM call and the token usage reported in its response, if any."""
+        usage = getattr(response, "usage", None)
+        record = {
+            "model": model,
+            "latency": latency,
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+        }
+        self.llm_calls.append(record)
+        self.counters["llm_calls"] += 1
+        self.counters["prompt_tokens"] += record["prompt_tokens"] or 0
+        self.counters["completion_tokens"] += record["completion_tokens"] or 0
+        self._emit("llm_call", **record)
+
+    def as_dict(self):
+        """Returns the collected data as plain dictionaries and lists (e.g. for json.dumps)."""
+        return {
+            "durations": dict(self.durations),
+            "counters": dict(self.counters),
+            "headings": list(self.headings),
+            "llm_calls": list(self.llm_calls),
+        }
+
+    def _emit(self, event, **data):
+        if self.callback is not None:
+            self.callback(event, data)
+
+
+def current_stats():
+    """Returns the active PipelineStats, or None if instrumentation is disabled."""
+    return _active_stats.get()
+
+
+@contextmanager
+def instrument(stats=None, callback=None):
+    """
+    Enables instrumentation for the with-block, including the asyncio tasks and
+    asyncio.to_thread calls started from it (worker processes are not instrumented).
+
+    Example:
+        with instrument() as stats:
+            toc = create_toc(text, model)
+            result = extractor.extract_content_by_toc(toc, text, verbose=True)
+        print(stats.as_dict())
+
+    Args:
+        stats: The PipelineStats to record into; a new one is created if None.
+        callback: The callback of the new PipelineStats (see PipelineStats).
+
+    Yields:
+        The active PipelineStats.
+    """
+    if stats is None:
+        stats = PipelineStats(callback)
+    token = _active_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _active_stats.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Measures the with-block as a stage of the active PipelineStats; does nothing if disabled."""
+    stats = _active_stats.get()
+    if stats is None:
+        yield None
+        return
+    with stats.stage(name):
+        yield stats
@@ -0,0 +1,134 @@
+from typing import NamedTuple, Optional, Tuple
+
+
+class Chunk(NamedTuple):
+    """A size-bounded piece of a section, with the headings leading to it."""
+
+    heading_path: Tuple[str, ...]  # The headings from the top level down to the section
+    text: str
+    start: int  # Offsets of the piece in the original text
+    end: int
+
+    @property
+    def context(self):
+        """The heading path as one line, e.g. "Chapter 1 > Section 2", to prepend before embedding."""
+        return " > ".join(self.heading_path)
+
+
+class SectionNode:
+    """
+    A node of the section tree built by build_section_tree.
+
+    The root node has no record (level 0); every other node wraps the SectionRecord of one
+    TOC line and loads its content from the original text only when it is read.
+
+    Attributes:
+        record: The SectionRecord of the node, or None for the root.
+        parent: The parent node, or None for the root.
+        children: The child nodes, in TOC order.
+    """
+
+    __slots__ = ("record", "parent", "children")
+
+    def __init__(self, record=None, parent=None):
+        self.record = record
+        self.parent = parent
+        self.children = []
+
+    @property
+    def level(self):
+        return self.record.level if self.record is not None else 0
+
+    @property
+    def heading(self) -> Optional[str]:
+        return self.record.heading if self.record is not None else None
+
+    @property
+    def content(self) -> Optional[str]:
+        """The text of the section itself (without its children), or None if it was not found."""
+        return self.record.content if self.record is not None else None
+
+    @property
+    def heading_path(self):
+        """The headings from the top level down to this node (a tuple of strings)."""
+        path = []
+        node = self
+        while node.record is not None:
+            path.append(node.record.heading)
+            node = node.parent
+        return tuple(reversed(path))
+
+    def iter_nodes(self):
+        """Yields the nodes below this one in document order (depth first)."""
+        stack = list(reversed(self.children))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def __repr__(self):
+        return f"SectionNode(level={self.level}, heading={self.heading!r}, children={len(self.children)})"
+
+
+def build_section_tree(records):
+    """
+    Builds the section hierarchy from section records in TOC order:
+    each section becomes a child of the closest preceding section with a lower level.
+
+    Args:
+        records: SectionRecord objects, e.g. from TocContentExtractor.extract_sections.
+
+    Returns:
+        The root SectionNode.
+    """
+    root = SectionNode()
+    stack = [root]
+    for record in records:
+        while stack[-1].level >= record.level:
+            stack.pop()
+        node = SectionNode(record, stack[-1])
+        stack[-1].children.append(node)
+        stack.append(node)
+    return root
+
+
+def _split_span(text, start, end, max_chars):
+    """Yields (start, end) pieces of text[start:end] of at most max_chars, cut at line breaks where possible."""
+    while end - start > max_chars:
+        cut = start + max_chars
+        # Prefer to end the piece at a line break in its second half
+        line_end = text.rfind("\n", start + max_chars // 2, cut)
+        if line_end >= 0:
+            cut = line_end + 1
+        yield start, cut
+        start = cut
+    yield start, end
+
+
+def iter_chunks(root, max_chars=1000):
+    """
+    Yields size-bounded chunks of every found section below root, in document order,
+    each with the heading path of its section as context.
+
+    Chunks are sliced from the original text as they are yielded, so they can be streamed
+    into an embedder without holding all section texts in memory.
+
+    Args:
+        root: A SectionNode, usually the root returned by build_section_tree.
+        max_chars: The maximum number of characters of a chunk's text.
+
+    Yields:
+        Chunk tuples. Empty and whitespace-only pieces are skipped.
+    """
+    if max_chars <= 0:
+        raise ValueError("max_chars must be positive.")
+    for node in root.iter_nodes():
+        record = node.record
+        if not record.matched:
+            continue
+        text = record.source
+        heading_path = node.heading_path
+        for start, end in _split_span(text, record.start, record.end, max_chars):
+            piece = text[start:end].strip()
+            if piece:
+                yield Chunk(heading_path, piece, start, end)
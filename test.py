@@ -1,4 +1,13 @@
-from toc_content_extractor import TocContentExtractor
+import os
+import pickle
+import re
+import tempfile
+import unicodedata
+
+from heading_index import HeadingIndex
+from pipeline_stats import instrument
+from section_tree import iter_chunks
+from toc_content_extractor import IncrementalExtraction, TocContentExtractor
 
 # テスト用の目次とコンテンツ
 toc = """# 勇者ロトの伝説：新たなる冒険
@@ -131,12 +140,233 @@ def extract_content_by_toc(toc, content):
     assert merged_result == expected, f"\nGot:\n{merged_result}\nExpected:\n{expected}"
     print("Test passed. The merged content matches the expected output.")
 
+def extract_content_by_toc_with_automaton(toc, content):
+    # automaton エンジンが regex エンジンと同じ結果を返すことを検証
+    regex_result = TocContentExtractor(toc_max_level=5).extract_content_by_toc(toc, content, verbose=True)
+    matcher = TocContentExtractor(toc_max_level=5, engine="automaton")
+    merged_result = matcher.extract_content_by_toc(toc, content, verbose=True)
+    assert merged_result == regex_result, f"\nGot:\n{merged_result}\nExpected:\n{regex_result}"
+    assert merged_result["markdown_content"] == expected
+    print("Test passed. The automaton engine matches the regex engine.")
 
-if __name__ == "__main__":
-    extract_content_by_toc(toc, content)
-    extract_content_by_toc_without_verbose(toc, content)
+def extract_content_by_toc_reuses_pattern_cache(toc, content):
+    # 同じインスタンスで2回目の抽出を行うと、コンパイル済みパターンが再利用されることを検証
+    matcher = TocContentExtractor(toc_max_level=5)
+    first_result = matcher.extract_content_by_toc(toc, content)
+    first_info = matcher.pattern_cache_info()
+    second_result = matcher.extract_content_by_toc(toc, content)
+    second_info = matcher.pattern_cache_info()
+    assert first_result == second_result == expected
+    assert second_info.misses == first_info.misses
+    assert second_info.hits == first_info.hits + first_info.misses
+    # プロセスプールに渡せるよう、キャッシュを持ったままでも pickle できる
+    copied = pickle.loads(pickle.dumps(matcher))
+    assert copied.pattern_cache_info().currsize == 0
+    assert copied.extract_content_by_toc(toc, content) == expected
+    print("Test passed. The pattern cache is reused across calls.")
+
+def extract_content_by_toc_keep_original(toc, content):
+    # keep_original=True の場合、元の改行や空白を保ったまま同じ範囲が切り出されることを検証
+    matcher = TocContentExtractor(toc_max_level=5)
+    merged_result = matcher.extract_content_by_toc(toc, content, verbose=True, keep_original=True)
+    original_list = merged_result["markdown_content_list"]
+    assert original_list[2:4] == ['## 旅立ち', '旅 立 ち\n物語は、勇者ロトが新たな冒険に出るところから始まる。']
+    assert len(original_list) == len(expected_markdown_list)
+    for original, normalized in zip(original_list[1::2], expected_markdown_list[1::2]):
+        assert matcher.normalize(original) == normalized, f"\nGot:\n{original}\nExpected:\n{normalized}"
+    print("Test passed. The original text is kept for each section.")
+
+def extract_content_by_toc_with_fuzzy():
+    # 先頭・末尾の文字が崩れた見出しも fuzzy エンジンで見つかることを検証
+    garbled_toc = """# Chapter One Introduction
+# Chapter Two Methods
+# Chapter Three Results"""
+    garbled_content = """Chapter One Introduction
+Intro text.
+Xhapter Two Methodz
+Methods text.
+Chapter Three Results
+Results text."""
+    matcher = TocContentExtractor(engine="fuzzy")
+    merged_result = matcher.extract_content_by_toc(garbled_toc, garbled_content, verbose=True)
+    assert merged_result["match_failed"] == []
+    assert merged_result["markdown_content_list"] == [
+        "# Chapter One Introduction",
+        "chapteroneintroductionintrotext.",
+        "# Chapter Two Methods",
+        "xhaptertwomethodzmethodstext.",
+        "# Chapter Three Results",
+        "chapterthreeresultsresultstext.",
+    ]
+    print("Test passed. The fuzzy engine recovers garbled headings.")
 
+def iter_sections(toc, content):
+    # iter_sections が extract_content_by_toc と同じセクションを順に返すことを検証
+    matcher = TocContentExtractor(toc_max_level=5)
+    sections = list(matcher.iter_sections(toc, content))
+    assert len(sections) == 20
+    matched_list = []
+    for section in sections:
+        if section.matched:
+            matched_list.extend([section.heading, section.content])
+    assert matched_list == expected_markdown_list
+    assert [section.failed_heading for section in sections if section.failed_heading] == [
+        '#### 謎の老人', '#### 1.2. 生贄の祭壇', '##### 2.1.1. 弓使いとの連携', '#### 2.2. ドワーフの砦の救援'
+    ]
+    print("Test passed. iter_sections yields the same sections.")
+
+def incremental_extraction(toc, content):
+    # 目次の編集や本文の追記で、影響を受けるセクションだけが再計算されることを検証
+    # オートマトンでも、抽出器の検索エンジンがそのまま使われることを確認する
+    for engine in ("regex", "automaton"):
+        matcher = TocContentExtractor(toc_max_level=5, engine=engine)
+        incremental = IncrementalExtraction(matcher, toc, content)
+        assert incremental.result() == expected
+        if engine == "automaton":
+            assert incremental.locator is not None
+
+        edited_toc = toc.replace("### 最初の試練", "### 最初の試練（改）").replace("## ロトの帰還", "## ロ ト の 帰 還")
+        recomputed = incremental.update_toc(edited_toc)
+        assert recomputed == [2, 3, 16, 17], recomputed
+        assert incremental.result(verbose=True) == matcher.extract_content_by_toc(edited_toc, content, verbose=True)
+
+        appended_content = "\nエ ピ ロ ー グ\nそして伝説へ。"
+        edited_toc += "\n## エピローグ"
+        incremental.update_toc(edited_toc)
+        recomputed = incremental.append_content(appended_content)
+        assert recomputed[-2:] == [19, 20], recomputed
+        assert incremental.result(verbose=True) == matcher.extract_content_by_toc(
+            edited_toc, content + appended_content, verbose=True
+        )
+
+    # 追記の境界で正規化が変わる場合（語末のシグマ）も、全体を正規化した結果と一致する
+    sigma_toc = "# Intro\n## Chapter Two"
+    for first, appended in (("Intro text Α", "Σ more"), ("Intro ΑΣ.", "Β more\nChapter Two")):
+        incremental = IncrementalExtraction(matcher, sigma_toc, first)
+        incremental.append_content(appended)
+        assert incremental.normalized_content == matcher.normalize(first + appended)
+        assert incremental.result(verbose=True) == matcher.extract_content_by_toc(
+            sigma_toc, first + appended, verbose=True
+        )
+    print("Test passed. The incremental extraction matches a full extraction.")
 
 
+def normalize_batch(toc, content):
+    matcher = TocContentExtractor()
 
+    def normalize_with_nfkc(text):
+        return re.sub(r"[\s\u3000]+", "", unicodedata.normalize("NFKC", text).lower())
+
+    # 濁点の合成・ハングル字母・語末のシグマなど、前後の文字に依存する正規化も含める
+    texts = toc.splitlines() + [
+        content,
+        "ｶﾞｲﾄﾞ　ｶﾞｲﾄﾞ",
+        "か\u3099き\u309a\nＡＢＣ１２３",
+        "ᄀ\u1161ㄱㅏ",
+        "ΟΔΥΣΣΕΥΣ ΣΑ",
+        "",
+    ]
+    expected = [normalize_with_nfkc(text) for text in texts]
+    assert matcher.normalize_batch(texts) == expected
+    assert [matcher.normalize(text) for text in texts] == expected
+    print("Test passed. The batch normalization matches NFKC normalization.")
+
+
+def extract_content_by_toc_with_stats(toc, content):
+    matcher = TocContentExtractor(toc_max_level=5)
+    expected = matcher.extract_content_by_toc(toc, content, verbose=True)
+    assert "stats" not in expected
 
+    # 計測を有効にすると、見出しごとの検索回数・トリム回数と処理時間が verbose 出力に含まれる
+    with instrument() as stats:
+        result = matcher.extract_content_by_toc(toc, content, verbose=True)
+    assert result.pop("stats") is stats
+    assert result == expected
+    assert [record["heading"] for record in stats.headings] == expected["toc_list"]
+    assert stats.counters["trims"] == sum(record["trims"] for record in stats.headings) > 0
+    assert stats.counters["search_attempts"] == len(stats.headings) + stats.counters["trims"]
+    assert stats.counters["scanned_chars"] > len(matcher.normalize(content))
+    assert stats.durations["extract"] >= stats.durations["normalize"] > 0
+    print("Test passed. The extraction stats are reported in the verbose output.")
+
+
+def extract_content_by_toc_with_heading_index(toc, content):
+    # 同じテンプレートの文書群の目次から索引を作り、保存・読み込みしても結果が変わらないことを検証
+    other_toc = toc.replace("## ロトの帰還", "## 新しい章\n## ロトの帰還")
+    index = HeadingIndex([toc, other_toc], toc_max_level=5)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "headings.index")
+        index.save(path)
+        loaded_index = HeadingIndex.load(path)
+    assert len(loaded_index) == len(index) > 0
+
+    expected = TocContentExtractor(toc_max_level=5).extract_content_by_toc(toc, content, verbose=True)
+    for engine in ("regex", "automaton"):
+        matcher = TocContentExtractor(toc_max_level=5, engine=engine, heading_index=loaded_index)
+        assert matcher.extract_content_by_toc(toc, content, verbose=True) == expected
+        # 索引にない見出しを含む目次でも同じ結果になる
+        unknown_toc = toc.replace("## ロトの帰還", "## 未知の章\n## ロトの帰還")
+        assert matcher.extract_content_by_toc(
+            unknown_toc, content, verbose=True
+        ) == TocContentExtractor(toc_max_level=5).extract_content_by_toc(unknown_toc, content, verbose=True)
+    print("Test passed. The shared heading index gives the same result.")
+
+
+def extract_sections(toc, content):
+    matcher = TocContentExtractor(toc_max_level=5)
+    expected = matcher.extract_content_by_toc(toc, content, verbose=True, keep_original=True)
+    records = matcher.extract_sections(toc, content)
+
+    # 見出しレベル・見出し・一致状況がそろい、本文は元テキストの範囲を遅延して切り出す
+    assert [record.toc_line for record in records] == expected["toc_list"]
+    assert [record.level for record in records][:3] == [1, 2, 3]
+    assert [record.toc_line for record in records if record.matched] == expected["match_success"]
+    matched_contents = [record.content for record in records if record.matched]
+    assert matched_contents == expected["markdown_content_list"][1::2]
+    assert all(record.content is None and record.start == record.end for record in records if not record.matched)
+    assert all(record.start <= record.end for record in records)
+    assert not hasattr(records[0], "__dict__") and records[0].source is content
+    print("Test passed. The section records match the extracted content.")
+
+
+def extract_section_tree(toc, content):
+    matcher = TocContentExtractor(toc_max_level=5)
+    root = matcher.extract_section_tree(toc, content)
+
+    # 見出しレベルに従って親子関係が作られる
+    assert [node.heading for node in root.children] == ["勇者ロトの伝説：新たなる冒険"]
+    chapters = root.children[0].children
+    assert [node.heading for node in chapters] == ["旅立ち", "魔王の復活", "ロトの帰還"]
+    assert [node.heading for node in chapters[1].children] == ["1. 闇の儀式", "2. 魔王軍の侵攻", "3. 決戦の地へ"]
+    assert chapters[1].children[1].children[0].children[0].heading_path == (
+        "勇者ロトの伝説：新たなる冒険", "魔王の復活", "2. 魔王軍の侵攻", "2.1. エルフの森の防衛戦", "2.1.1. 弓使いとの連携",
+    )
+    records = matcher.extract_sections(toc, content)
+    assert [node.heading for node in root.iter_nodes()] == [record.heading for record in records]
+
+    # チャンクは上限以下の長さで、見出しのパスを持ち、元テキストの範囲を覆う
+    chunks = list(iter_chunks(root, max_chars=40))
+    assert all(0 < len(chunk.text) <= 40 for chunk in chunks)
+    assert all(content[chunk.start : chunk.end].strip() == chunk.text for chunk in chunks)
+    assert chunks[-1].context == "勇者ロトの伝説：新たなる冒険 > ロトの帰還 > 新たな旅の予感"
+    for node in root.iter_nodes():
+        if node.content:
+            pieces = [chunk.text for chunk in chunks if chunk.start >= node.record.start and chunk.end <= node.record.end]
+            assert "".join(pieces).replace("\n", "") == node.content.replace("\n", "")
+    print("Test passed. The section tree and chunks follow the TOC hierarchy.")
+
+
+if __name__ == "__main__":
+    extract_content_by_toc(toc, content)
+    extract_content_by_toc_without_verbose(toc, content)
+    extract_content_by_toc_with_automaton(toc, content)
+    extract_content_by_toc_reuses_pattern_cache(toc, content)
+    extract_content_by_toc_keep_original(toc, content)
+    extract_content_by_toc_with_fuzzy()
+    iter_sections(toc, content)
+    incremental_extraction(toc, content)
+    normalize_batch(toc, content)
+    extract_content_by_toc_with_stats(toc, content)
+    extract_content_by_toc_with_heading_index(toc, content)
+    extract_sections(toc, content)
+    extract_section_tree(toc, content)
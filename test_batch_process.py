@@ -0,0 +1,73 @@
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+
+from batch_process import extract_by_toc, load_extractor, process_documents
+
+
+def fake_completion(model, messages):
+    # プロンプト中の「#」で始まる行をそのまま目次として返すローカルの偽 completion 関数
+    text = messages[0]["content"].split("## Text", 1)[1]
+    toc = "\n".join(line for line in text.splitlines() if line.startswith("#"))
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=toc))])
+
+
+def process_documents_writes_outputs_and_resumes():
+    # 文書ごとの出力と結果マニフェストが書き出され、再実行時は最新の文書がスキップされることを検証
+    with tempfile.TemporaryDirectory() as directory:
+        input_directory = os.path.join(directory, "input")
+        output_directory = os.path.join(directory, "output")
+        os.makedirs(os.path.join(input_directory, "sub"))
+        for name in ["a.txt", "b.txt", os.path.join("sub", "c.txt")]:
+            with open(os.path.join(input_directory, name), "w", encoding="utf-8") as f:
+                f.write(f"# {name} の見出し\n{name} の本文です。\n## 第2節\n第2節の本文です。\n")
+
+        records = process_documents(
+            input_directory, output_directory, "fake", max_workers=2, completion_fn=fake_completion
+        )
+        assert sorted(record["status"] for record in records) == ["ok"] * 3, records
+        # 各文書の処理段階ごとの時間とカウンタが記録される
+        assert all(record["stats"]["counters"]["llm_calls"] == 1 for record in records)
+        assert all("extract" in record["stats"]["durations"] for record in records)
+        with open(os.path.join(output_directory, "sub", "c.md"), encoding="utf-8") as f:
+            assert f.read() == "# sub/c.txt の見出し\n#sub/c.txtの見出しsub/c.txtの本文です。##\n## 第2節\n第2節第2節の本文です。"
+        with open(os.path.join(output_directory, "manifest.jsonl"), encoding="utf-8") as f:
+            assert len([json.loads(line) for line in f]) == 3
+
+        # 更新された文書だけが再処理される
+        os.utime(os.path.join(input_directory, "b.txt"), (2**31, 2**31))
+        records = process_documents(
+            input_directory, output_directory, "fake", max_workers=2, completion_fn=fake_completion
+        )
+        statuses = {os.path.basename(record["source"]): record["status"] for record in records}
+        assert statuses == {"a.txt": "skipped", "b.txt": "ok", "c.txt": "skipped"}, statuses
+
+        # 結果マニフェストを入力として渡すこともできる（再実行で重複した文書は一度だけ処理される）
+        records = process_documents(
+            os.path.join(output_directory, "manifest.jsonl"), os.path.join(directory, "output2"), "fake",
+            max_workers=1, completion_fn=fake_completion,
+        )
+        assert len(records) == 3 and all(record["status"] in ("ok", "skipped") for record in records)
+    print("Test passed. The batch run writes outputs and resumes.")
+
+
+
+def extract_by_toc_reuses_extractor():
+    # 同じオプションの文書では抽出器が使い回され、共通の見出しのパターンが再利用されることを検証
+    options = {"model": "fake", "completion_fn": fake_completion, "toc_max_level": 2}
+    extractor = load_extractor(2, "regex", None)
+    hits = []
+    for month in ["4月", "5月"]:
+        text = f"# 月次報告 {month}\n概要です。\n## 売上\n売上の本文です。\n## 課題\n課題の本文です。\n"
+        toc, _, match_success, match_failed = extract_by_toc(text, None, options)
+        assert (match_success, match_failed) == (3, 0), toc
+        hits.append(extractor.pattern_cache_info().hits)
+    # 2つ目の文書では「売上」「課題」のパターンがキャッシュから返される
+    assert hits[1] >= hits[0] + 2, hits
+    print("Test passed. The extractor is shared by the documents of a batch.")
+
+
+if __name__ == "__main__":
+    process_documents_writes_outputs_and_resumes()
+    extract_by_toc_reuses_extractor()
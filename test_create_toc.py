@@ -0,0 +1,361 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+from types import SimpleNamespace
+
+from create_toc import (
+    MARKDOWN_PROMPT_TEMPLATE,
+    TokenBucket,
+    acreate_toc,
+    acreate_streaming_toc,
+    acreate_tocs,
+    acreate_windowed_toc,
+    create_line_toc,
+    create_toc,
+    iter_text_windows,
+    merge_tocs,
+    split_text_into_windows,
+)
+from heading_candidates import find_heading_candidates
+from line_toc import LineHeading, line_toc_anchors, line_toc_to_markdown, parse_line_toc
+from pipeline_stats import instrument
+from toc_cache import TocCache
+from toc_content_extractor import IncrementalExtraction, TocContentExtractor
+from toc_repair import find_failed_regions, repair_failed_headings
+
+
+def make_fake_acompletion(latency):
+    # 遅延を注入したローカルの偽 completion 関数（プロンプト中の「##」行をそのまま目次として返す）
+    async def fake_acompletion(model, messages):
+        await asyncio.sleep(latency)
+        text = messages[0]["content"].split("## Text", 1)[1]
+        toc = "\n".join(line for line in text.splitlines() if line.startswith("# "))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=toc))])
+
+    return fake_acompletion
+
+
+def split_text_into_windows_with_overlap():
+    # ウィンドウが全体を覆い、隣接するウィンドウが重なることを検証
+    text = "".join(f"{i}行目のテキストです。\n" for i in range(1000))
+    windows = split_text_into_windows(text, window_size=2000, overlap=200)
+    assert len(windows) > 1
+    assert all(len(window) <= 2000 for window in windows)
+    assert windows[0] == text[: len(windows[0])]
+    assert text.endswith(windows[-1])
+    for previous, current in zip(windows, windows[1:]):
+        assert previous.endswith(current[:200])
+    print("Test passed. The windows cover the text with overlap.")
+
+
+def iter_text_windows_matches_split():
+    # チャンク単位で届くテキストからも、全体を一括で分割した場合と同じウィンドウが得られることを検証
+    text = "".join(f"{i}行目のテキストです。\n" for i in range(1000))
+    pages = [text[i : i + 777] for i in range(0, len(text), 777)]
+    windows = list(iter_text_windows(iter(pages), window_size=2000, overlap=200))
+    assert windows == split_text_into_windows(text, window_size=2000, overlap=200)
+    print("Test passed. The streamed windows match the split windows.")
+
+
+def merge_tocs_drops_overlap_duplicates():
+    # 重なり部分で重複した見出しだけが除かれることを検証
+    partial_tocs = [
+        "# 第1章\n## 1.1 概要\n## 1.2 背景",
+        "## 1.2　背景\n# 第2章\n## まとめ",
+        "# 第3章\n## まとめ",
+    ]
+    merged = merge_tocs(partial_tocs)
+    assert merged == "# 第1章\n## 1.1 概要\n## 1.2 背景\n# 第2章\n## まとめ\n# 第3章\n## まとめ", merged
+    print("Test passed. The partial TOCs are merged in order.")
+
+
+def acreate_tocs_scales_with_concurrency():
+    # 並列数を上げると、全体の所要時間が呼び出し回数に比例しなくなることを検証
+    texts = [f"# 文書{i}\n本文です。" for i in range(8)]
+    fake_acompletion = make_fake_acompletion(latency=0.1)
+
+    start = time.perf_counter()
+    serial_tocs = asyncio.run(acreate_tocs(texts, "fake", max_concurrency=1, completion_fn=fake_acompletion))
+    serial_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel_tocs = asyncio.run(acreate_tocs(texts, "fake", max_concurrency=8, completion_fn=fake_acompletion))
+    parallel_time = time.perf_counter() - start
+
+    assert serial_tocs == parallel_tocs == [f"# 文書{i}" for i in range(8)]
+    assert serial_time >= 0.8
+    assert parallel_time < serial_time / 3, (serial_time, parallel_time)
+    print(f"Test passed. Wall time {serial_time:.2f}s (1 in flight) -> {parallel_time:.2f}s (8 in flight).")
+
+
+def acreate_tocs_respects_rate_limit_and_timeout():
+    # レート制限とタイムアウトが適用されることを検証
+    texts = [f"# 文書{i}" for i in range(5)]
+    start = time.perf_counter()
+    tocs = asyncio.run(
+        acreate_tocs(texts, "fake", max_concurrency=5, rate_limiter=TokenBucket(rate=20),
+                     completion_fn=make_fake_acompletion(latency=0))
+    )
+    assert time.perf_counter() - start >= 0.2 - 0.01
+    assert tocs == texts
+
+    tocs = asyncio.run(
+        acreate_tocs(texts, "fake", timeout=0.05, completion_fn=make_fake_acompletion(latency=1))
+    )
+    assert tocs == [None] * 5
+    print("Test passed. The rate limit and timeout are applied.")
+
+
+def acreate_windowed_toc_merges_windows():
+    # ウィンドウごとの目次が並列に生成され、1つの目次にまとめられることを検証
+    text = "".join(f"# 見出し{i}\n" + "本文です。\n" * 20 for i in range(20))
+    toc = asyncio.run(
+        acreate_windowed_toc(text, "fake", window_size=500, window_overlap=100, max_concurrency=8,
+                             completion_fn=make_fake_acompletion(latency=0.01))
+    )
+    assert toc == "\n".join(f"# 見出し{i}" for i in range(20)), toc
+    print("Test passed. The windowed TOCs are merged.")
+
+
+def acreate_streaming_toc_overlaps_reading_and_requests():
+    # ページの読み込み中に、完成したウィンドウのリクエストが並行して進むことを検証
+    def slow_pages():
+        for i in range(10):
+            time.sleep(0.05)  # ページのデコード時間
+            yield f"# 見出し{i}\n" + "本文です。\n" * 40
+
+    start = time.perf_counter()
+    toc = asyncio.run(
+        acreate_streaming_toc(slow_pages(), "fake", window_size=300, window_overlap=50, max_concurrency=16,
+                              completion_fn=make_fake_acompletion(latency=0.2))
+    )
+    elapsed = time.perf_counter() - start
+    assert toc == "\n".join(f"# 見出し{i}" for i in range(10)), toc
+    # 逐次処理なら 0.5s（読み込み）+ ウィンドウ数 x 0.2s かかる
+    assert elapsed < 0.5 + 0.2 * 2, elapsed
+    print(f"Test passed. The streaming TOC finished in {elapsed:.2f}s.")
+
+
+def acreate_streaming_toc_bounds_pending_windows():
+    # LLM がページの読み込みより遅いときは読み込みも待たされ、保持されるウィンドウが max_concurrency 程度に抑えられることを検証
+    pages_read = []
+    held_pages = []
+
+    def fast_pages():
+        for i in range(20):
+            pages_read.append(i)
+            yield f"# 見出し{i}\n" + "本文です。\n" * 40
+
+    fake_acompletion = make_fake_acompletion(latency=0.02)
+
+    async def counting_acompletion(model, messages):
+        held_pages.append(len(pages_read) - len(held_pages))
+        return await fake_acompletion(model, messages)
+
+    toc = asyncio.run(
+        acreate_streaming_toc(fast_pages(), "fake", window_size=300, window_overlap=50, max_concurrency=2,
+                              completion_fn=counting_acompletion)
+    )
+    assert toc == "\n".join(f"# 見出し{i}" for i in range(20)), toc
+    assert max(held_pages) <= 2 + 2, held_pages
+    print("Test passed. The streaming TOC reads ahead by at most max_concurrency windows.")
+
+
+def create_toc_uses_persistent_cache():
+    # 2回目以降の同じリクエストはキャッシュから返され、LLM が呼ばれないことを検証
+    calls = []
+
+    def fake_completion(model, messages):
+        calls.append(model)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"# 目次{len(calls)}"))])
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "toc_cache.sqlite3")
+        cache = TocCache(path)
+        assert create_toc("本文", "fake", cache=cache, completion_fn=fake_completion) == "# 目次1"
+        cache.close()
+
+        # 別のインスタンス（次回の実行）でもキャッシュが使われる
+        cache = TocCache(path)
+        assert create_toc("本文", "fake", cache=cache, completion_fn=fake_completion) == "# 目次1"
+        assert create_toc("本文", "other", cache=cache, completion_fn=fake_completion) == "# 目次2"
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+        assert stats["bytes_saved"] > len("本文".encode("utf-8"))
+        cache.close()
+
+        # bypass=True では常に LLM が呼ばれ、結果は保存される
+        cache = TocCache(path, bypass=True)
+        assert create_toc("本文", "fake", cache=cache, completion_fn=fake_completion) == "# 目次3"
+        cache.close()
+
+        # サイズ上限を超えると、最も長く使われていないエントリから削除される
+        cache = TocCache(path, max_bytes=len("# 目次3".encode("utf-8")) * 2)
+        assert create_toc("新しい本文", "fake", cache=cache, completion_fn=fake_completion) == "# 目次4"
+        assert create_toc("本文", "fake", cache=cache, completion_fn=fake_completion) == "# 目次3"
+        assert create_toc("本文", "other", cache=cache, completion_fn=fake_completion) == "# 目次5"
+        cache.close()
+
+        # TTL を過ぎたエントリは使われない
+        cache = TocCache(path, ttl=0)
+        assert create_toc("本文", "fake", cache=cache, completion_fn=fake_completion) == "# 目次6"
+        cache.close()
+
+        # キャッシュの読み書きに失敗しても、生成済みの目次は捨てられない
+        class LockedCache(TocCache):
+            def get(self, key):
+                raise sqlite3.OperationalError("database is locked")
+
+            def put(self, key, toc, request_size=0):
+                raise sqlite3.OperationalError("database is locked")
+
+        cache = LockedCache(path)
+        assert create_toc("本文", "fake", cache=cache, completion_fn=fake_completion) == "# 目次7"
+        assert asyncio.run(acreate_toc("## Text\n# 見出し", "fake", completion_fn=make_fake_acompletion(0), cache=cache)) == "# 見出し"
+        cache.close()
+    print("Test passed. The TOC cache avoids repeated completions.")
+
+
+def create_toc_records_llm_stats():
+    # 計測を有効にすると、LLM 呼び出しの回数・トークン数・レイテンシが記録されることを検証
+    def fake_completion(model, messages):
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="# 目次"))], usage=usage)
+
+    events = []
+    with instrument(callback=lambda event, data: events.append(event)) as stats:
+        text = "".join(f"{i}行目のテキストです。\n" for i in range(300))
+        assert create_toc(text, "fake", window_size=2000, completion_fn=fake_completion) == "# 目次"
+        window_count = len(split_text_into_windows(text, 2000))
+    assert stats.counters["llm_calls"] == window_count > 1
+    assert stats.counters["prompt_tokens"] == 100 * window_count
+    assert stats.counters["completion_tokens"] == 20 * window_count
+    assert all(call["latency"] >= 0 for call in stats.llm_calls)
+    assert stats.durations["create_toc"] > 0
+    assert events.count("llm_call") == window_count
+
+    # 計測していないときは何も記録されない
+    create_toc(text, "fake", completion_fn=fake_completion)
+    assert stats.counters["llm_calls"] == window_count
+    print("Test passed. LLM calls are recorded while instrumented.")
+
+
+def create_toc_with_prefilter():
+    # 見出し候補の行だけが行番号付きでプロンプトに含まれることを検証
+    prompts = []
+
+    def fake_completion(model, messages):
+        prompts.append(messages[0]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="# 旅立ち"))])
+
+    body = "勇者は王様に会いに行き、旅の支度を整えた。\n" * 50
+    text = f"旅 立 ち\n{body}\n第2章 魔王の復活\n{body}\n2.1. 闇の儀式\n{body}"
+    assert find_heading_candidates(text) == [(1, "旅 立 ち"), (53, "第2章 魔王の復活"), (105, "2.1. 闇の儀式")]
+    assert create_toc(text, "fake", completion_fn=fake_completion, prefilter=True) == "# 旅立ち"
+    prompt = prompts[0].split("## Heading candidates", 1)[1]
+    assert prompt.strip() == "1: 旅 立 ち\n53: 第2章 魔王の復活\n105: 2.1. 闇の儀式"
+    assert len(prompts[0]) < len(MARKDOWN_PROMPT_TEMPLATE.format(text=text)) / 5
+    print("Test passed. The prefilter sends only the heading candidates.")
+
+
+def create_toc_heuristic_fallback():
+    # LLM を使わない目次生成と、LLM の失敗・タイムアウト時のフォールバックを検証
+    body = "勇者は王様に会いに行き、旅の支度を整えた。\n"
+    text = f"第1章 旅立ち\n{body}\n1. ルーラの町\n{body}\n1.1. 最初の試練\n{body}\n第2章 魔王の復活\n{body}"
+    expected = "# 第1章 旅立ち\n## 1. ルーラの町\n### 1.1. 最初の試練\n# 第2章 魔王の復活"
+    assert create_toc(text, "heuristic") == expected
+    # 小数で始まる本文の行は番号付きの見出しとして扱わない
+    decimal_line = "3.5 kg of flour were used in total"
+    assert find_heading_candidates(f"{body}{decimal_line}\n{body}") == []
+    assert create_toc(text + f"{decimal_line}\n{body}", "heuristic") == expected
+
+    def failing_completion(model, messages):
+        raise RuntimeError("service unavailable")
+
+    assert create_toc(text, "fake", completion_fn=failing_completion) is None
+    assert create_toc(text, "fake", completion_fn=failing_completion, heuristic_fallback=True) == expected
+
+    toc = asyncio.run(
+        acreate_toc(text, "fake", timeout=0.05, completion_fn=make_fake_acompletion(1), heuristic_fallback=True)
+    )
+    assert toc == expected
+    print("Test passed. The heuristic TOC is used without an LLM and as a fallback.")
+
+
+def create_line_toc_slices_by_line_numbers():
+    # 行番号付きの目次から、見出しを検索せずに行のオフセットでセクションを切り出せることを検証
+    prompts = []
+
+    def fake_completion(model, messages):
+        prompts.append(messages[0]["content"])
+        # 箇条書き・重複・範囲外・空行を指す行は無視される
+        content = "1 1\n- 2 L4: 1. ルーラの町\n2 4\n## 6\n3 99\n1 2\nありません"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    text = "第1章 旅立ち\n\n勇者は旅に出た。\n1. ルーラの町\n町は静かだった。\n1.1. 最初の試練\n試練が始まった。"
+    headings = create_line_toc(text, "fake", completion_fn=fake_completion)
+    assert headings == [LineHeading(1, 1), LineHeading(2, 4), LineHeading(2, 6)]
+    assert prompts[0].split("## Lines", 1)[1].strip().splitlines()[:2] == ["1: 第1章 旅立ち", "3: 勇者は旅に出た。"]
+    assert line_toc_to_markdown(headings, text) == "# 第1章 旅立ち\n## 1. ルーラの町\n## 1.1. 最初の試練"
+
+    records = TocContentExtractor().extract_sections_at(line_toc_anchors(headings, text), text)
+    assert [record.content for record in records] == [
+        "第1章 旅立ち\n\n勇者は旅に出た。",
+        "1. ルーラの町\n町は静かだった。",
+        "1.1. 最初の試練\n試練が始まった。",
+    ]
+    # 区切りのない行や、プロンプトの「行番号: 行」をそのまま返した行は見出しとして読まない
+    assert parse_line_toc("41: 2\n12 5\n3:4\n1. 6\n26", text) == [LineHeading(1, 6)]
+    assert parse_line_toc("4: 1. ルーラの町\n3: 1. Intro\n2, 4", text) == [LineHeading(2, 4)]
+    assert create_line_toc(text, "heuristic") == [LineHeading(1, 1), LineHeading(2, 4), LineHeading(3, 6)]
+    print("Test passed. The line-numbered TOC slices the sections by line offsets.")
+
+
+def repair_failed_headings_sends_only_damaged_regions():
+    # 見つからなかった見出しの周辺だけを再度問い合わせ、修正した行で該当セクションだけを再抽出することを検証
+    prompts = []
+
+    def fake_completion(model, messages):
+        prompts.append(messages[0]["content"])
+        # 前後の目次の行をそのまま返しても、既に見つかった見出しは失われない
+        content = "## 第2章 ルーラの町\n## 第3章 魔王の復活\n## 第3章 魔王の復活\n## 第4章 伝説の終わり"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    chapters = ["第1章 旅立ちの朝", "第2章 ルーラの町", "第3章 魔王の復活", "第4章 伝説の終わり"]
+    bodies = [f"{chapter[:3]}の本文です。" * 40 for chapter in chapters]
+    content = "\n".join(f"{chapter}\n{body}" for chapter, body in zip(chapters, bodies))
+    toc = "# 勇者の物語\n## 第1章 旅立ちの朝\n## 第2章 ルーラの町\n## 第3章 魔王ノ復活\n## 第4章 伝説の終わり"
+    extractor = TocContentExtractor()
+    extraction = IncrementalExtraction(extractor, toc, content)
+    assert extraction.result(verbose=True)["match_failed"] == ["## 第3章 魔王ノ復活"]
+    assert [region[:2] for region in find_failed_regions(extraction.sections)] == [(3, 3)]
+
+    recomputed = repair_failed_headings(extraction, "fake", context_chars=5, completion_fn=fake_completion)
+    assert len(prompts) == 1
+    assert "第2章" in prompts[0] and "第3章の本文" in prompts[0]
+    assert "第1章の本文" not in prompts[0] and "第4章の本文" not in prompts[0]
+    assert recomputed == [2, 3]
+    repaired_toc = toc.replace("魔王ノ復活", "魔王の復活")
+    assert extraction.toc_list == repaired_toc.splitlines()
+    assert extraction.result(verbose=True) == extractor.extract_content_by_toc(repaired_toc, content, verbose=True)
+    assert extraction.result(verbose=True)["match_failed"] == []
+    print("Test passed. Only the regions of the failed headings are sent again.")
+
+
+if __name__ == "__main__":
+    split_text_into_windows_with_overlap()
+    iter_text_windows_matches_split()
+    merge_tocs_drops_overlap_duplicates()
+    acreate_tocs_scales_with_concurrency()
+    acreate_tocs_respects_rate_limit_and_timeout()
+    acreate_windowed_toc_merges_windows()
+    acreate_streaming_toc_overlaps_reading_and_requests()
+    acreate_streaming_toc_bounds_pending_windows()
+    create_toc_uses_persistent_cache()
+    create_toc_records_llm_stats()
+    create_toc_with_prefilter()
+    create_toc_heuristic_fallback()
+    create_line_toc_slices_by_line_numbers()
+    repair_failed_headings_sends_only_damaged_regions()
@@ -0,0 +1,120 @@
+import os
+import tempfile
+
+from pdf_layout import detect_layout_headings, extract_layout_from_pdf, layout_headings_to_toc
+from pdf_text_extractor import (
+    extract_pages_from_pdf_parallel,
+    extract_text_from_pdf,
+    extract_text_from_pdf_parallel,
+    iter_pdf_page_batches,
+    iter_pdf_pages,
+)
+from toc_content_extractor import TocContentExtractor
+
+
+def write_sample_pdf(path, page_lines):
+    # ページごとの行を Helvetica で書いた最小限の PDF を作成する
+    # 行は文字列（12pt）か、(フォントサイズ, 太字かどうか, 文字列) のタプル
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >>",
+    ]
+    page_ids = []
+    for lines in page_lines:
+        commands = "BT 72 720 Td "
+        for line in lines:
+            size, bold, text = (12, False, line) if isinstance(line, str) else line
+            commands += f"/F{2 if bold else 1} {size} Tf {size + 2} TL ({text}) Tj T* "
+        commands += "ET"
+        stream = commands.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+            % len(objects)
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def extract_text_from_pdf_parallel_matches_serial():
+    # 並列抽出の結果がページ順に並び、逐次抽出と一致することを検証
+    page_lines = [[f"Chapter {page}", f"Body text of page {page}."] for page in range(1, 8)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sample.pdf")
+        write_sample_pdf(path, page_lines)
+        serial_text = extract_text_from_pdf(path)
+        pages = extract_pages_from_pdf_parallel(path, max_workers=3)
+        assert len(pages) == 7
+        for page, lines in zip(pages, page_lines):
+            assert lines[0] in page and lines[1] in page, page
+        assert "".join(pages) == serial_text
+        assert extract_text_from_pdf_parallel(path, max_workers=2) == serial_text
+
+        # ページツリーの /Count が誤っていても、ページが欠落しない
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data.replace(b"/Count 7", b"/Count 3"))
+        assert extract_text_from_pdf_parallel(path, max_workers=2) == serial_text
+    print("Test passed. The parallel extraction matches the serial extraction.")
+
+
+def iter_pdf_pages_streams_pages():
+    # ページが1ページずつ（またはバッチで）順に返され、全体の抽出結果と一致することを検証
+    page_lines = [[f"Chapter {page}", f"Body text of page {page}."] for page in range(1, 6)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sample.pdf")
+        write_sample_pdf(path, page_lines)
+        pages = iter_pdf_pages(path)
+        assert "Chapter 1" in next(pages)
+        assert "".join(iter_pdf_pages(path)) == extract_text_from_pdf(path)
+        batches = list(iter_pdf_page_batches(path, batch_size=2))
+        assert [len(batch) for batch in batches] == [2, 2, 1]
+        assert [page for batch in batches for page in batch] == list(iter_pdf_pages(path))
+        pages.close()
+    print("Test passed. The pages are streamed in order.")
+
+
+def detect_layout_headings_from_font_metrics():
+    # フォントサイズと太字から見出しを検出し、その位置でセクションを切り出せることを検証
+    page_lines = [
+        [(20, True, "Annual Report"), "This report covers the year.", (16, False, "Sales Results"), "Sales grew by ten percent."],
+        [(16, False, "Outlook"), (12, True, "Risks"), "Costs may rise next year.", "Demand stays strong."],
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sample.pdf")
+        write_sample_pdf(path, page_lines)
+        text, lines = extract_layout_from_pdf(path)
+        assert text == extract_text_from_pdf(path)
+        for line in lines:
+            assert text[line.start : line.end] == line.text, line
+        assert [line.page for line in lines if line.text == "Outlook"] == [1]
+
+        headings = detect_layout_headings(lines)
+        assert layout_headings_to_toc(headings) == "# Annual Report\n## Sales Results\n## Outlook\n### Risks"
+        records = TocContentExtractor().extract_sections_at(headings, text)
+        assert [record.heading for record in records] == ["Annual Report", "Sales Results", "Outlook", "Risks"]
+        assert records[1].content == "Sales Results\nSales grew by ten percent."
+        assert records[3].content == "Risks\nCosts may rise next year.\nDemand stays strong."
+    print("Test passed. Headings are detected from the font metrics.")
+
+
+if __name__ == "__main__":
+    extract_text_from_pdf_parallel_matches_serial()
+    iter_pdf_pages_streams_pages()
+    detect_layout_headings_from_font_metrics()
@@ -0,0 +1,78 @@
+from functools import lru_cache
+import unicodedata
+
+# Characters with canonical or compatibility decompositions all lie below this code point
+_DECOMPOSABLE_LIMIT = 0x2FA20
+# Separates the texts of a batch; a starter that never composes, changes case or is removed
+_BATCH_SEPARATOR = "\x00"
+# NFKC leaves ASCII unchanged, so ASCII text only needs lower case and no whitespace.
+# Mapping ASCII to ASCII (or None) keeps str.translate on its fast path.
+_ASCII_TABLE = {codepoint: "".join(chr(codepoint).lower().split()) or None for codepoint in range(128)}
+
+
+@lru_cache(maxsize=None)
+def _composing_starters():
+    """Returns the characters with combining class 0 that canonically compose with a preceding character."""
+    starters = set()
+    for codepoint in range(_DECOMPOSABLE_LIMIT):
+        decomposition = unicodedata.decomposition(chr(codepoint)).split()
+        if len(decomposition) == 2 and not decomposition[0].startswith("<"):
+            second = chr(int(decomposition[1], 16))
+            if not unicodedata.combining(second):
+                starters.add(second)
+    return frozenset(starters)
+
+
+@lru_cache(maxsize=None)
+def joins_previous_character(char):
+    """
+    Returns True if NFKC may compose the character with the one before it
+    (combining marks, half-width voiced sound marks, Hangul vowel/final jamo, vowel signs
+    that compose with a preceding vowel sign).
+    """
+    if char < "\x80":
+        return False
+    decomposed = unicodedata.normalize("NFKD", char)[0]
+    return (
+        unicodedata.combining(decomposed) != 0
+        or "\u1160" <= decomposed <= "\u11ff"
+        or decomposed in _composing_starters()
+    )
+
+
+def normalize_text(text):
+    """
+    Normalizes the text like TocContentExtractor.normalize: NFKC, lower case and
+    no whitespace (including the ideographic space).
+
+    ASCII text is mapped through a translation table in one pass. Other text skips NFKC
+    when it is already normalized, and whitespace is removed with str.split(), which
+    matches the same characters as the regular expression "[\\s\\u3000]+" at a fraction of its cost.
+
+    Args:
+        text: The text to normalize.
+
+    Returns:
+        The normalized text.
+    """
+    if text.isascii():
+        return text.translate(_ASCII_TABLE)
+    if not unicodedata.is_normalized("NFKC", text):
+        text = unicodedata.normalize("NFKC", text)
+    return "".join(text.lower().split())
+
+
+def normalize_texts(texts):
+    """
+    Normalizes many texts (e.g. every heading of a TOC, or a set of documents) in a single pass.
+
+    Args:
+        texts: An iterable of texts.
+
+    Returns:
+        The list of normalized texts, in order.
+    """
+    texts = list(texts)
+    if len(texts) < 2 or any(_BATCH_SEPARATOR in text for text in texts):
+        return [normalize_text(text) for text in texts]
+    return normalize_text(_BATCH_SEPARATOR.join(texts)).split(_BATCH_SEPARATOR)
@@ -0,0 +1,135 @@
+import hashlib
+import sqlite3
+import time
+
+
+class TocCache:
+    """
+    Persistent, content-addressed cache of generated TOCs, stored in SQLite.
+
+    Entries are keyed by a hash of the prompt template, the model name and the input text,
+    so a TOC is reused only when the exact same request would be sent again.
+
+    Args:
+        path: The SQLite database file.
+        max_bytes: The maximum total size of the cached TOCs; the least recently used
+            entries are evicted beyond it. None means no limit.
+        ttl: The number of seconds an entry stays valid, or None to keep entries forever.
+        bypass: If True, cached entries are ignored (but new results are still stored),
+            which forces a refresh.
+    """
+
+    def __init__(self, path="toc_cache.sqlite3", max_bytes=None, ttl=None, bypass=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS toc_cache (
+                key TEXT PRIMARY KEY,
+                toc TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                request_size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS toc_cache_accessed ON toc_cache (accessed)"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(prompt_template, model, text):
+        """Returns the cache key of a TOC request."""
+        digest = hashlib.sha256()
+        for part in (prompt_template, model, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached TOC for the key, or None on a miss.
+        """
+        row = None
+        if not self.bypass:
+            row = self._connection.execute(
+                "SELECT toc, size, request_size, created FROM toc_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+        now = time.time()
+        if row is not None and self.ttl is not None and row[3] < now - self.ttl:
+            self._connection.execute("DELETE FROM toc_cache WHERE key = ?", (key,))
+            self._connection.commit()
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+
+        toc, size, request_size, _ = row
+        self._connection.execute(
+            "UPDATE toc_cache SET accessed = ? WHERE key = ?", (now, key)
+        )
+        self._connection.commit()
+        self.hits += 1
+        self.bytes_saved += size + request_size
+        return toc
+
+    def put(self, key, toc, request_size=0):
+        """
+        Stores a TOC and evicts the least recently used entries if the size cap is exceeded.
+
+        Args:
+            key: The cache key (see make_key).
+            toc: The generated TOC.
+            request_size: The size in bytes of the prompt that produced it, counted as saved on hits.
+        """
+        now = time.time()
+        size = len(toc.encode("utf-8"))
+        self._connection.execute(
+            "INSERT OR REPLACE INTO toc_cache VALUES (?, ?, ?, ?, ?, ?)",
+            (key, toc, size, request_size, now, now),
+        )
+        if self.max_bytes is not None:
+            self._evict()
+        self._connection.commit()
+
+    def _evict(self):
+        (total,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM toc_cache"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._connection.execute(
+            "SELECT key, size FROM toc_cache ORDER BY accessed"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._connection.executemany("DELETE FROM toc_cache WHERE key = ?", evicted)
+
+    def stats(self):
+        """
+        Returns the cache statistics of this instance:
+        hits, misses, hit_rate and bytes_saved (prompt and response bytes not sent over the network).
+        """
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "bytes_saved": self.bytes_saved,
+        }
+
+    def close(self):
+        self._connection.close()
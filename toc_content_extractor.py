@@ -1,12 +1,133 @@
+from array import array
 from collections import Counter
+from difflib import SequenceMatcher
+from functools import lru_cache
+from itertools import repeat
 import re
-import unicodedata
+from typing import NamedTuple, Optional
+
+from heading_locator import HeadingLocator, find_approximate
+from pipeline_stats import current_stats, stage
+from section_tree import build_section_tree
+from text_normalizer import joins_previous_character, normalize_text, normalize_texts
+
+
+def _offset_typecode(length):
+    """The smallest array typecode that holds the offsets of a text of this length."""
+    return "I" if length < 2**32 and array("I").itemsize >= 4 else "q"
+
+
+class Section(NamedTuple):
+    """A section of the content located by TocContentExtractor.iter_sections."""
+
+    heading: str  # The TOC line, e.g. "## Chapter 1"
+    content: Optional[str]  # The extracted text, or None if the section was not found
+    matched: bool
+    failed_heading: Optional[str]  # The next TOC line that could not be found, if any
+    search_position: int  # The search start position after this section
+    attempts: int = 1  # The number of searches made for the next heading (trimmed retries included)
+
+
+class SectionRecord:
+    """
+    A section located by TocContentExtractor.extract_sections.
+
+    The record keeps offsets into the original text instead of a copy of the section,
+    and slices it only when content is read.
+
+    Attributes:
+        level: The heading level (the number of "#" of the TOC line).
+        heading: The heading text, without the "#" marks.
+        start: The offset in the original text where the section starts.
+        end: The offset in the original text where the section ends
+            (equal to start if the section was not found).
+        matched: True if the end of the section was found.
+        source: The original text the offsets refer to (shared by all records, not copied).
+    """
+
+    __slots__ = ("level", "heading", "start", "end", "matched", "source")
+
+    def __init__(self, level, heading, start, end, matched, source):
+        self.level = level
+        self.heading = heading
+        self.start = start
+        self.end = end
+        self.matched = matched
+        self.source = source
+
+    @property
+    def toc_line(self):
+        """The TOC line of the section, e.g. "## Chapter 1" (with a single space after the marks)."""
+        return "#" * self.level + " " + self.heading
+
+    @property
+    def content(self):
+        """The text of the section as it appears in the original text, or None if not found."""
+        if not self.matched:
+            return None
+        return self.source[self.start : self.end].strip()
+
+    def __repr__(self):
+        return (
+            f"SectionRecord(level={self.level}, heading={self.heading!r}, "
+            f"start={self.start}, end={self.end}, matched={self.matched})"
+        )
 
 
 class TocContentExtractor:
-    def __init__(self, toc_search_min_length: int = 6, toc_max_level: int = 3):
+    ENGINES = ("regex", "automaton", "fuzzy")
+
+    def __init__(
+        self,
+        toc_search_min_length: int = 6,
+        toc_max_level: int = 3,
+        engine: str = "regex",
+        pattern_cache_size: int = 1024,
+        max_edit_distance: int = 2,
+        heading_index=None,
+    ):
+        """
+        Args:
+            toc_search_min_length: Headings are trimmed on failed searches until they are shorter than this.
+            toc_max_level: The maximum heading level to extract.
+            engine: The heading search engine.
+                "regex" searches each heading with a regular expression over the rest of the document.
+                "automaton" locates all headings in a single linear pass with an Aho-Corasick automaton.
+                "fuzzy" looks for each heading once, accepting approximate matches instead of
+                trimming the heading and searching again. Unlike the other engines, it matches
+                "#" in a heading literally rather than as a wildcard.
+            pattern_cache_size: The maximum number of compiled heading patterns kept by this instance.
+                The cache is shared across extract_content_by_toc calls.
+            max_edit_distance: The edit-distance budget of the "fuzzy" engine. The budget of a heading
+                is capped at one edit per 4 characters of the normalized heading, so short headings get fewer.
+            heading_index: A heading_index.HeadingIndex built from known TOCs. If given, the
+                "regex" and "automaton" engines locate headings with its precompiled automaton,
+                scanning each document once (the output does not change).
+        """
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine: {engine}. Choose from {self.ENGINES}.")
         self.toc_search_min_length = toc_search_min_length
         self.toc_max_level = toc_max_level
+        self.engine = engine
+        self.max_edit_distance = max_edit_distance
+        self.heading_index = heading_index
+        self.pattern_cache_size = pattern_cache_size
+        self._create_pattern_cache()
+
+    def _create_pattern_cache(self):
+        self._section_pattern_cache = lru_cache(maxsize=self.pattern_cache_size)(
+            self._compile_section_pattern
+        )
+
+    def __getstate__(self):
+        # The cache wraps a bound method and cannot be pickled; workers rebuild it empty
+        state = self.__dict__.copy()
+        del state["_section_pattern_cache"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._create_pattern_cache()
 
     def find_closest_match(self, matches, N):
         """Returns the match from matches that is closest in length to N."""
@@ -20,10 +141,75 @@ class TocContentExtractor:
         """
         Normalizes the text, ignoring differences between full-width and half-width characters.
         """
-        # Convert the string to the normalized form 'NFKC'
-        text = unicodedata.normalize("NFKC", text)
-        # Remove spaces
-        return re.sub(r"[\s\u3000]+", "", text.lower())
+        # Same as NFKC, lower() and removing spaces (see text_normalizer.normalize_text)
+        return normalize_text(text)
+
+    def normalize_batch(self, texts):
+        """
+        Normalizes many texts (e.g. headings or documents) like normalize() in a single pass.
+
+        Args:
+            texts: An iterable of texts.
+
+        Returns:
+            The list of normalized texts, in order.
+        """
+        return normalize_texts(texts)
+
+    def normalize_with_offsets(self, text):
+        """
+        Normalizes the text like normalize() and maps each normalized position back to the original text.
+
+        Args:
+            text: The original text.
+
+        Returns:
+            A tuple (normalized_text, offsets).
+            offsets is an array of len(normalized_text) + 1 positions in the original text
+            (4 bytes per position for texts shorter than 2**32 characters):
+            offsets[i] is where the character that produced normalized_text[i] starts,
+            and offsets[-1] is len(text).
+        """
+        normalized_text = self.normalize(text)
+        offsets = self._build_offsets(text, self._normalization_clusters(text))
+        if len(offsets) != len(normalized_text) + 1:
+            # A composition crossed a cluster boundary; lines never compose with each other
+            offsets = self._build_offsets(text, self._line_clusters(text))
+        return normalized_text, offsets
+
+    def _normalization_clusters(self, text):
+        """Yields (start, end) ranges of characters that NFKC normalizes independently."""
+        joins_previous = joins_previous_character
+        start = 0
+        for position, char in enumerate(text):
+            if position and not joins_previous(char):
+                yield start, position
+                start = position
+        if text:
+            yield start, len(text)
+
+    def _line_clusters(self, text):
+        start = 0
+        for line in text.splitlines(keepends=True):
+            yield start, start + len(line)
+            start += len(line)
+
+    def _build_offsets(self, text, clusters):
+        offsets = array(_offset_typecode(len(text)))
+        append = offsets.append
+        # Normalized lengths per distinct cluster; documents reuse a small set of characters
+        normalized_lengths = {}
+        for start, end in clusters:
+            cluster = text[start:end]
+            length = normalized_lengths.get(cluster)
+            if length is None:
+                length = normalized_lengths[cluster] = len(self.normalize(cluster))
+            if length == 1:
+                append(start)
+            elif length:
+                offsets.extend(repeat(start, length))
+        append(len(text))
+        return offsets
 
     def generate_filtered_toc(self, toc_list, toc_max_level):
         """
@@ -62,43 +248,164 @@ class TocContentExtractor:
         Converts a TOC to a regular expression format.
         """
         normalized_line = self.normalize(toc)
-        pattern = re.sub(r"[#\s]+", r".*", re.escape(normalized_line))
-        return re.compile(pattern).pattern
+        return self._normalized_heading_to_regex(normalized_line)
+
+    def _normalized_heading_to_regex(self, normalized_line):
+        return re.sub(r"[#\s]+", r".*", re.escape(normalized_line))
+
+    def _compile_section_pattern(self, normalized_line):
+        return re.compile(
+            f"(.*?)(?={self._normalized_heading_to_regex(normalized_line)})", re.DOTALL
+        )
 
-    def extract_content_by_toc(self, toc_text: str, content: str, verbose=False):
+    def compile_section_pattern(self, toc):
         """
-        Extracts the corresponding section from the content using the TOC.
+        Returns the compiled pattern that matches the text up to the next occurrence of a TOC line.
+        Patterns are cached by the normalized heading text.
+        """
+        return self._section_pattern_cache(self.normalize(toc))
+
+    def pattern_cache_info(self):
+        """
+        Returns the hit/miss statistics of the compiled pattern cache
+        (a functools CacheInfo with hits, misses, maxsize and currsize).
+        """
+        return self._section_pattern_cache.cache_info()
+
+    def clear_pattern_cache(self):
+        """Clears the compiled pattern cache and its statistics."""
+        self._section_pattern_cache.cache_clear()
+
+    def heading_search_variants(self, toc_line):
+        """
+        Returns the normalized strings that may be searched for a TOC line,
+        i.e. the heading itself and its trimmed forms tried on failed searches.
+        """
+        return self.normalize_batch(self._heading_trims(toc_line))
+
+    def _heading_trims(self, toc_line):
+        toc_line_temp = toc_line.lstrip("#").lstrip(" ")
+        trims = [toc_line_temp]
+        while len(toc_line_temp) > 0:
+            toc_line_temp = toc_line_temp[1:-1]
+            if len(toc_line_temp) < self.toc_search_min_length:
+                break
+            trims.append(toc_line_temp)
+        return trims
+
+    def build_heading_locator(self, toc_list, normalized_content):
+        """
+        Builds a HeadingLocator for every literal search variant of the TOC lines.
+        """
+        return HeadingLocator(self.heading_patterns(toc_list[1:]), normalized_content)
+
+    def heading_patterns(self, toc_list):
+        """
+        Returns the literal (wildcard-free) normalized search variants of the TOC lines,
+        i.e. the strings a HeadingLocator needs to answer their searches.
+        """
+        trims = [trim for toc_line in toc_list for trim in self._heading_trims(toc_line)]
+        return [variant for variant in self.normalize_batch(trims) if "#" not in variant]
+
+    def find_heading_end(self, locator, heading, normalized_content, search_start):
+        """
+        Returns the absolute end position of the section that stops right before the heading,
+        or None if the heading does not appear after search_start.
+        """
+        normalized_heading = self.normalize(heading)
+        if "#" in normalized_heading:
+            # '#' becomes a wildcard in convert_toc_to_regex, so fall back to the regex
+            match = self._section_pattern_cache(normalized_heading).search(
+                normalized_content, search_start
+            )
+            return match.end() if match else None
+        return locator.find(normalized_heading, search_start)
+
+    def find_fuzzy_heading_end(self, heading, normalized_content, search_start):
+        """
+        Returns the absolute end position of the section that stops right before
+        the closest approximate occurrence of the heading, or None if there is none within budget.
+        """
+        normalized_heading = self.normalize(heading)
+        max_distance = min(self.max_edit_distance, len(normalized_heading) // 4)
+        return find_approximate(
+            normalized_content, normalized_heading, search_start, max_distance
+        )
+
+    def iter_sections(self, toc_text: str, content: str, keep_original=False):
+        """
+        Extracts the sections of the content one by one, in TOC order.
+        Each section is yielded as soon as the position of the following heading is resolved.
 
         Args:
             toc_text: The text of the table of contents.
             content: The content to extract from.
-            verbose: If True, returns detailed information about the extraction process.
+            keep_original: If True, sections are sliced from the original content,
+                keeping its casing, spacing and newlines, instead of the normalized text.
 
-        Returns:
-            If verbose is False:
-                A string containing the extracted content.
-            If verbose is True:
-                A dictionary containing:
-                    - 'extracted_content': The extracted content.
-                    - 'match_success': A list of TOC lines that were successfully matched.
-                    - 'match_failed': A list of TOC lines that failed to match.
-                    - 'toc_list': The processed table of contents list.
-                    - 'search_positions': (Optional) A list of search start positions for each TOC line.
+        Yields:
+            A Section for every line of the filtered TOC.
+            Sections whose boundary could not be found have matched=False and content=None.
         """
-        result = []
-        normalized_content = self.normalize(content)
-        search_start = 0  # Manage the starting position of the search
-        match_success = []
-        match_failed = []
-        search_positions = []
+        toc_list = self.generate_filtered_toc(toc_text.splitlines(), self.toc_max_level)
+        return self._iter_toc_sections(toc_list, content, keep_original)
+
+    def _iter_toc_sections(self, toc_list, content, keep_original):
+        normalized_content, offsets, locator = self._prepare_search(
+            toc_list, content, keep_original
+        )
+        yield from self._locate_sections(
+            toc_list, content, normalized_content, offsets, locator
+        )
 
-        toc_list = toc_text.splitlines()
-        toc_list = self.generate_filtered_toc(toc_list, self.toc_max_level)
+    def _prepare_search(self, toc_list, content, keep_original):
+        """Returns the normalized content, its offsets (if keep_original) and the heading locator, if any."""
+        offsets = None
+        with stage("normalize"):
+            if keep_original:
+                normalized_content, offsets = self.normalize_with_offsets(content)
+            else:
+                normalized_content = self.normalize(content)
 
+        return normalized_content, offsets, self._build_locator(toc_list, normalized_content)
 
-        for i, toc_line in enumerate(toc_list):
+    def _build_locator(self, toc_list, normalized_content):
+        """Returns the HeadingLocator of the engine (or of the heading index), or None for the pattern search."""
+        locator = None
+        if self.heading_index is not None and self.engine != "fuzzy":
+            locator = self.heading_index.locator(normalized_content)
+        elif self.engine == "automaton":
+            locator = self.build_heading_locator(toc_list, normalized_content)
+        if locator is not None:
+            stats = current_stats()
+            if stats is not None:
+                # The automaton scans the text once; lookups do not scan it again
+                stats.count("scanned_chars", len(normalized_content))
+        return locator
+
+    def _locate_sections(
+        self,
+        toc_list,
+        content,
+        normalized_content,
+        offsets,
+        locator,
+        start_index=0,
+        search_start=0,
+        slice_content=True,
+    ):
+        """
+        Locates the sections of toc_list from start_index on, starting the search at search_start.
+        Without a locator, the "regex" and "automaton" engines search with the compiled patterns.
+        If slice_content is False, the content of the sections is left as None.
+        """
+        stats = current_stats()
+        for i in range(start_index, len(toc_list)):
+            toc_line = toc_list[i]
             # Extract the range up to the next heading
             next_toc_line = None
+            failed_toc_line = None
+            attempts = 0
             if i + 1 < len(toc_list):
                 next_toc_line = toc_list[i + 1]
 
@@ -107,17 +414,33 @@ class TocContentExtractor:
             toc_line_temp = toc_line.lstrip("#").lstrip(" ")
 
             while True:
-                target_text = normalized_content[search_start:]
-                if next_toc_line:
-                    # regex_patterns = f"({self.convert_toc_to_regex(toc_line_temp)})(.*?)(?={self.convert_toc_to_regex(next_toc_line_temp)})"
-                    regex_patterns = (
-                        f"(.*?)(?={self.convert_toc_to_regex(next_toc_line_temp)})"
+                attempts += 1
+                if next_toc_line is None:
+                    # The last section runs to the end of the content
+                    match_end = len(normalized_content)
+                elif self.engine == "fuzzy":
+                    match_end = self.find_fuzzy_heading_end(
+                        next_toc_line_temp, normalized_content, search_start
+                    )
+                elif locator is not None:
+                    match_end = self.find_heading_end(
+                        locator, next_toc_line_temp, normalized_content, search_start
                     )
                 else:
-                    # regex_patterns = f"({self.convert_toc_to_regex(toc_line_temp)})(.*)"
-                    regex_patterns = f"(.*)"
-                matches = list(re.finditer(regex_patterns, target_text, re.DOTALL))
-                if len(matches) > 0:
+                    # regex_patterns = f"({self.convert_toc_to_regex(toc_line_temp)})(.*?)(?={self.convert_toc_to_regex(next_toc_line_temp)})"
+                    regex_patterns = self.compile_section_pattern(next_toc_line_temp)
+                    # Only the first match is used, so stop at the first hit.
+                    # Searching from search_start avoids copying the unread tail of the content.
+                    match = regex_patterns.search(normalized_content, search_start)
+                    match_end = match.end() if match else None
+                if stats is not None and locator is None:
+                    scanned_end = len(normalized_content) if match_end is None else match_end
+                    stats.count("scanned_chars", scanned_end - search_start)
+                if match_end is not None:
+                    break
+                elif self.engine == "fuzzy":
+                    # Approximate matching already tolerates garbled characters, so there is nothing to retry
+                    failed_toc_line = next_toc_line
                     break
                 else:
                     if i == 0:
@@ -132,8 +455,7 @@ class TocContentExtractor:
                         len(toc_line_temp) < self.toc_search_min_length
                         or len(next_toc_line_temp) < self.toc_search_min_length
                     ):
-                        if verbose:
-                            match_failed.append(next_toc_line)
+                        failed_toc_line = next_toc_line
                         break
 
             # Select the longest content among the matches
@@ -141,19 +463,163 @@ class TocContentExtractor:
             # longest_match = max(matches, key=lambda m: len(m.group(1)), default=None)
 
             # if longest_match:
-            if len(matches) > 0:
-                longest_match = matches[0]
+            if match_end is None:
+                yield Section(
+                    toc_line, None, False, failed_toc_line, search_start, attempts
+                )
+                continue
+
+            if not slice_content:
+                extracted_text = None
+            elif offsets is not None:
+                extracted_text = content[offsets[search_start] : offsets[match_end]].strip()
+            else:
+                extracted_text = normalized_content[search_start:match_end].strip()
+                extracted_text = re.sub(r"\\s+", "", extracted_text)
+            # Update the search start position (start searching from the next position after the last hit)
+            search_start = match_end
+            yield Section(toc_line, extracted_text, True, None, search_start, attempts)
+
+    def extract_content_by_toc(
+        self, toc_text: str, content: str, verbose=False, keep_original=False
+    ):
+        """
+        Extracts the corresponding section from the content using the TOC.
+
+        Args:
+            toc_text: The text of the table of contents.
+            content: The content to extract from.
+            verbose: If True, returns detailed information about the extraction process.
+            keep_original: If True, sections are sliced from the original content,
+                keeping its casing, spacing and newlines, instead of the normalized text.
+
+        Returns:
+            If verbose is False:
+                A string containing the extracted content.
+            If verbose is True:
+                A dictionary containing:
+                    - 'extracted_content': The extracted content.
+                    - 'match_success': A list of TOC lines that were successfully matched.
+                    - 'match_failed': A list of TOC lines that failed to match.
+                    - 'toc_list': The processed table of contents list.
+                    - 'search_positions': (Optional) A list of search start positions for each TOC line.
+                    - 'stats': The active PipelineStats, if instrumentation is enabled
+                        (see pipeline_stats.instrument).
+        """
+        stats = current_stats()
+        with stage("extract"):
+            toc_list = toc_text.splitlines()
+            toc_list = self.generate_filtered_toc(toc_list, self.toc_max_level)
+            sections = self._iter_toc_sections(toc_list, content, keep_original)
+            if stats is not None:
+                sections = self._recorded_sections(sections, stats)
+            result = self._collect_result(toc_list, sections, verbose)
+        if verbose and stats is not None:
+            result["stats"] = stats
+        return result
+
+    def extract_sections(self, toc_text: str, content: str):
+        """
+        Extracts the sections of the content as SectionRecord objects.
+
+        Unlike extract_content_by_toc, no per-section strings are built: each record holds
+        its level, heading and offsets into the original content, and slices its content
+        only when it is read. The content of a record is the same as with keep_original=True.
+
+        Args:
+            toc_text: The text of the table of contents.
+            content: The content to extract from.
+
+        Returns:
+            A list of SectionRecord, one for every line of the filtered TOC, in TOC order.
+        """
+        stats = current_stats()
+        with stage("extract"):
+            toc_list = self.generate_filtered_toc(toc_text.splitlines(), self.toc_max_level)
+            normalized_content, offsets, locator = self._prepare_search(toc_list, content, True)
+            sections = self._locate_sections(
+                toc_list, content, normalized_content, offsets, locator, slice_content=False
+            )
+            if stats is not None:
+                sections = self._recorded_sections(sections, stats)
+
+            records = []
+            start = 0
+            for section in sections:
+                level = len(section.heading) - len(section.heading.lstrip("#"))
+                end = section.search_position
+                records.append(
+                    SectionRecord(
+                        level,
+                        section.heading.lstrip("#").strip(),
+                        offsets[start],
+                        offsets[end],
+                        section.matched,
+                        content,
+                    )
+                )
+                start = end
+        return records
+
+    def extract_sections_at(self, anchors, content: str):
+        """
+        Slices the content at known heading positions, without searching for the headings.
+
+        Use it when the headings come with exact offsets, e.g. the LayoutHeading tuples of
+        pdf_layout.detect_layout_headings. The records are laid out as in extract_sections:
+        each section runs up to the next heading, and the first one starts at the top of the content.
 
-                extracted_text = longest_match.group(1).strip()
-                if verbose:
-                    match_success.append(toc_line)
+        Args:
+            anchors: (level, heading, start) tuples in text order; start is the offset of the heading in content.
+                Anchors deeper than toc_max_level are skipped, so their text stays in the enclosing section.
+            content: The content the offsets refer to.
+
+        Returns:
+            A list of SectionRecord, one for every kept anchor.
+        """
+        anchors = [anchor for anchor in anchors if anchor[0] <= self.toc_max_level]
+        records = []
+        for index, (level, heading, _) in enumerate(anchors):
+            start = anchors[index][2] if index > 0 else 0
+            end = anchors[index + 1][2] if index + 1 < len(anchors) else len(content)
+            records.append(SectionRecord(level, heading, start, end, True, content))
+        return records
+
+    def extract_section_tree(self, toc_text: str, content: str):
+        """
+        Extracts the sections of the content as a tree following the TOC levels.
+
+        Args:
+            toc_text: The text of the table of contents.
+            content: The content to extract from.
+
+        Returns:
+            The root section_tree.SectionNode. Its descendants wrap the records of
+            extract_sections; pass it to section_tree.iter_chunks to get chunks for RAG.
+        """
+        return build_section_tree(self.extract_sections(toc_text, content))
+
+    def _recorded_sections(self, sections, stats):
+        for section in sections:
+            stats.record_heading(section.heading, section.attempts, section.matched)
+            yield section
+
+    def _collect_result(self, toc_list, sections, verbose):
+        """Builds the extract_content_by_toc output from the located sections."""
+        result = []
+        match_success = []
+        match_failed = []
+        search_positions = []
+
+        for section in sections:
+            if section.matched:
                 # Add to the result while keeping the original TOC format
-                result.append(toc_line)
-                result.append(re.sub(r"\\s+", "", extracted_text))
-                # Update the search start position (start searching from the next position after the last hit)
-                search_start += longest_match.end()
-            if verbose:
-                search_positions.append(search_start)
+                result.append(section.heading)
+                result.append(section.content)
+                match_success.append(section.heading)
+            if section.failed_heading is not None:
+                match_failed.append(section.failed_heading)
+            search_positions.append(section.search_position)
 
         if verbose:
             return {
@@ -166,3 +632,149 @@ class TocContentExtractor:
             }
         else:
             return "\n".join(result)
+
+
+class IncrementalExtraction:
+    """
+    Keeps the normalized content, its offset index and the located sections of an extraction,
+    so that TOC edits and appended content only recompute the affected sections.
+
+    Args:
+        extractor: The TocContentExtractor to use.
+        toc_text: The text of the table of contents.
+        content: The content to extract from.
+        keep_original: If True, sections are sliced from the original content (see extract_content_by_toc).
+    """
+
+    def __init__(self, extractor, toc_text, content, keep_original=False):
+        self.extractor = extractor
+        self.keep_original = keep_original
+        self.toc_list = extractor.generate_filtered_toc(
+            toc_text.splitlines(), extractor.toc_max_level
+        )
+        self._set_content(content)
+        self.sections = list(self._locate(0, 0))
+
+    def _set_content(self, content):
+        self.content = content
+        self.normalized_content, self.offsets, self.locator = self.extractor._prepare_search(
+            self.toc_list, content, self.keep_original
+        )
+
+    def _locate(self, start_index, search_start):
+        # Headings added by update_toc are not in the locator; it searches them directly in the text
+        return self.extractor._locate_sections(
+            self.toc_list,
+            self.content,
+            self.normalized_content,
+            self.offsets,
+            self.locator,
+            start_index,
+            search_start,
+        )
+
+    def result(self, verbose=False):
+        """Returns the current extraction in the format of extract_content_by_toc."""
+        return self.extractor._collect_result(self.toc_list, self.sections, verbose)
+
+    def update_toc(self, toc_text):
+        """
+        Applies an edited TOC. A section only depends on its heading, the next heading and the
+        position where its search starts, so the old section is reused wherever those are unchanged;
+        only the changed headings and their neighbours are searched again.
+
+        Returns:
+            The indexes (in the new filtered TOC) of the recomputed sections.
+        """
+        old_toc_list, old_sections = self.toc_list, self.sections
+        new_toc_list = self.extractor.generate_filtered_toc(
+            toc_text.splitlines(), self.extractor.toc_max_level
+        )
+        # Map the unchanged TOC lines of the new list to their old indexes
+        old_indexes = {}
+        matcher = SequenceMatcher(None, old_toc_list, new_toc_list, autojunk=False)
+        for old_start, new_start, size in matcher.get_matching_blocks():
+            for k in range(size):
+                old_indexes[new_start + k] = old_start + k
+
+        def old_position(index):
+            """Maps a new index (or the end of the list) to the old one, or None."""
+            if index == len(new_toc_list):
+                return len(old_toc_list)
+            return old_indexes.get(index)
+
+        self.toc_list = new_toc_list
+        self.sections = []
+        recomputed = []
+        search_start = 0
+        for index in range(len(new_toc_list)):
+            old_index = old_position(index)
+            if (
+                old_index is not None
+                and old_position(index + 1) == old_index + 1
+                and (index == 0) == (old_index == 0)
+                and (old_sections[old_index - 1].search_position if old_index else 0)
+                == search_start
+            ):
+                # Same heading, same next heading, same starting position: same result
+                section = old_sections[old_index]
+            else:
+                section = next(self._locate(index, search_start))
+                recomputed.append(index)
+            self.sections.append(section)
+            search_start = section.search_position
+        return recomputed
+
+    def append_content(self, text):
+        """
+        Appends text to the content. Sections whose next heading was found exactly on the first
+        search, before the last line of the previous content, keep their boundaries; the first
+        section that was not (failed, trimmed, approximate, on the last line, or the last one)
+        and all sections after it are recomputed.
+
+        Returns:
+            The indexes of the recomputed sections.
+        """
+        if not text:
+            return []
+        # NFKC and the final sigma of lower() never look across a line break, so only the last
+        # line of the content (from its line break, which a combining mark may attach to)
+        # is normalized again with the appended text
+        line_start = max(self.content.rfind("\n"), 0)
+        old_tail = self.content[line_start:]
+        stable_length = len(self.normalized_content) - len(self.extractor.normalize(old_tail))
+        self.content += text
+        tail = old_tail + text
+        if self.offsets is not None:
+            normalized_tail, offsets = self.extractor.normalize_with_offsets(tail)
+            del self.offsets[stable_length:]
+            if self.offsets.typecode != _offset_typecode(len(self.content)):
+                self.offsets = array("q", self.offsets)
+            self.offsets.extend(offset + line_start for offset in offsets)
+        else:
+            normalized_tail = self.extractor.normalize(tail)
+        self.normalized_content = self.normalized_content[:stable_length] + normalized_tail
+        self.locator = self.extractor._build_locator(self.toc_list, self.normalized_content)
+
+        start_index = 0
+        while start_index < len(self.sections) - 1 and self._is_stable_on_append(
+            start_index, stable_length
+        ):
+            start_index += 1
+        search_start = self.sections[start_index - 1].search_position if start_index else 0
+        self.sections = self.sections[:start_index]
+        self.sections.extend(self._locate(start_index, search_start))
+        return list(range(start_index, len(self.sections)))
+
+    def _is_stable_on_append(self, index, stable_length):
+        section = self.sections[index]
+        if not section.matched or section.attempts != 1:
+            return False
+        next_heading = self.extractor.normalize(self.toc_list[index + 1].lstrip("#"))
+        # '#' is a wildcard in the regex, so a longer content could match earlier.
+        # A heading that ends in the unchanged text cannot be preceded by a new occurrence.
+        return (
+            "#" not in next_heading
+            and section.search_position + len(next_heading) <= stable_length
+            and self.normalized_content.startswith(next_heading, section.search_position)
+        )
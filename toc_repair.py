@@ -0,0 +1,122 @@
+import re
+from typing import NamedTuple
+
+from litellm import completion
+
+from create_toc import REPAIR_PROMPT_TEMPLATE, create_toc
+
+# Characters of text sent on each side of a damaged region, so the model sees where it starts and ends
+REPAIR_CONTEXT_CHARS = 200
+
+
+class FailedRegion(NamedTuple):
+    """A run of consecutive TOC lines that were not found, and the text they should be in."""
+
+    first: int  # Index in the filtered TOC of the first heading not found
+    last: int  # Index of the last one
+    start: int  # Span of the region in the normalized content: from the last found heading
+    end: int  # up to the next found heading
+
+
+def find_failed_regions(sections):
+    """
+    Groups the headings that were not found into regions of the content.
+
+    Section i is not matched when heading i + 1 was not found; the search of the next matched
+    section starts at the same position, so its end bounds the text of the missing headings.
+
+    Args:
+        sections: The located sections of an extraction (IncrementalExtraction.sections).
+
+    Returns:
+        A list of FailedRegion, in TOC order.
+    """
+    regions = []
+    index = 0
+    while index < len(sections):
+        if sections[index].matched:
+            index += 1
+            continue
+        first = index
+        # The last section runs to the end of the content, so it is always matched
+        while not sections[index].matched:
+            index += 1
+        regions.append(
+            FailedRegion(first + 1, index, sections[first].search_position, sections[index].search_position)
+        )
+    return regions
+
+
+def _repair_request(toc_list, region, excerpt):
+    nearby = toc_list[max(0, region.first - 1) : region.last + 2]
+    return "\n\n".join(
+        [
+            "## TOC lines around the excerpt",
+            "\n".join(nearby),
+            "## Headings not found",
+            "\n".join(toc_list[region.first : region.last + 1]),
+            "## Excerpt",
+            excerpt,
+        ]
+    )
+
+
+def repair_failed_headings(
+    extraction,
+    model,
+    context_chars=REPAIR_CONTEXT_CHARS,
+    completion_fn=completion,
+    cache=None,
+):
+    """
+    Asks the model again for the headings that were not found, sending only the text where
+    they should be (plus context_chars on each side) instead of the whole document.
+
+    The corrected lines replace the failed ones in the TOC, ignoring lines the model copied
+    from the rest of the TOC, and only the affected sections are extracted again
+    (see IncrementalExtraction.update_toc). Regions whose request fails are left as they are.
+
+    Example:
+        extraction = IncrementalExtraction(extractor, toc, input_text)
+        repair_failed_headings(extraction, model)
+        result = extraction.result(verbose=True)
+
+    Args:
+        extraction: An IncrementalExtraction; it is updated in place.
+        model: The model to use.
+        context_chars: The number of characters of context around each region.
+        completion_fn: The completion function (litellm's completion by default).
+        cache: A TocCache to reuse the answers of identical requests, or None.
+
+    Returns:
+        The indexes (in the repaired TOC) of the recomputed sections.
+    """
+    regions = find_failed_regions(extraction.sections)
+    if not regions:
+        return []
+    content = extraction.content
+    offsets = extraction.offsets
+    if offsets is None:
+        _, offsets = extraction.extractor.normalize_with_offsets(content)
+
+    toc_list = list(extraction.toc_list)
+    # From the last region, so the indexes of the earlier ones stay valid while splicing
+    for region in reversed(regions):
+        start = max(0, offsets[region.start] - context_chars)
+        end = min(len(content), offsets[region.end] + context_chars)
+        response = create_toc(
+            _repair_request(toc_list, region, content[start:end]),
+            model,
+            cache=cache,
+            completion_fn=completion_fn,
+            prompt_template=REPAIR_PROMPT_TEMPLATE,
+        )
+        if response is None:
+            continue
+        corrected = [line.strip() for line in response.splitlines() if re.match(r"^\s*#{1,6}\s", line)]
+        # Echoed TOC lines would be duplicates, and generate_filtered_toc drops every copy of those
+        outside = set(toc_list[: region.first]) | set(toc_list[region.last + 1 :])
+        toc_list[region.first : region.last + 1] = [
+            line for line in dict.fromkeys(corrected) if line not in outside
+        ]
+    return extraction.update_toc("\n".join(toc_list))